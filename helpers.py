@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import sublime
+
+
+def get_package_name(package):
+    """
+    Returns the name of a package, falling back to the last segment of the
+    details URL like Package Control does
+
+    :param package:
+        A dict of package info from a repository
+
+    :return:
+        The package name, or None
+    """
+
+    if 'name' in package:
+        return package['name']
+    if 'details' in package:
+        return package['details'].rstrip('/').split('/')[-1]
+    return None
+
+
+def get_cache_dir():
+    """
+    :return:
+        The folder to store files generated by this package in, which may
+        not exist yet
+    """
+
+    if hasattr(sublime, 'cache_path'):
+        return os.path.join(sublime.cache_path(), 'ChannelRepositoryTools')
+    return os.path.join(sublime.packages_path(), 'User', 'ChannelRepositoryTools.cache')
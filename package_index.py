@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+if sys.version_info >= (3,):
+    from .package_offsets import find_package_offsets
+    from .tests import find_channel_folder, show_channel_folder_error
+    from .helpers import get_package_name, get_cache_dir
+else:
+    from package_offsets import find_package_offsets
+    from tests import find_channel_folder, show_channel_folder_error
+    from helpers import get_package_name, get_cache_dir
+
+import sublime
+import sublime_plugin
+
+
+# Bump when the format of the persisted index changes
+INDEX_VERSION = 1
+
+# The fields of each package that are indexed for lookups
+LOOKUP_FIELDS = ['name', 'previous_names', 'details', 'labels']
+
+
+class FindChannelPackageCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        folder = find_channel_folder(self.window)
+        if folder is None:
+            show_channel_folder_error()
+            return
+
+        def build():
+            index = get_package_index(folder)
+            sublime.set_timeout(lambda: self.show(folder, index), 0)
+
+        sublime.status_message(u'ChannelRepositoryTools: indexing packages')
+        threading.Thread(target=build).start()
+
+    def show(self, folder, index):
+        entries = []
+        items = []
+        for entry in index.entries():
+            # Packages with neither a name nor details are invalid, but are
+            # still listed so they can be found and fixed
+            name = entry['name'] or u'(package without a name or details)'
+            entries.append(entry)
+            description = u'%s:%d' % (entry['path'], entry['line'])
+            if entry.get('details'):
+                description += u' - ' + entry['details']
+            items.append([name, description])
+
+            # Previous names are listed too, so renamed packages can be found
+            for previous_name in entry_values(entry, 'previous_names'):
+                entries.append(entry)
+                items.append([previous_name, u'Previous name of %s' % name])
+
+        def on_done(i):
+            if i == -1:
+                return
+            entry = entries[i]
+            path = os.path.join(folder, entry['path'])
+            self.window.open_file(u'%s:%d' % (path, entry['line']), sublime.ENCODED_POSITION)
+
+        self.window.show_quick_panel(items, on_done)
+
+        if index.invalid:
+            sublime.status_message(u'ChannelRepositoryTools: unable to parse %s, ' % u', '.join(sorted(index.invalid)) +
+                u'showing the packages from when it was last valid')
+
+
+class PackageIndex(object):
+    """
+    An index of the packages in every repository JSON file of a channel
+    folder, allowing lookups by name, previous name, details URL and label
+    without parsing the repository files again
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        # Keys are paths relative to the folder, values are dicts with the
+        # keys "mtime" and "packages"
+        self.files = {}
+        # Keys are the fields in LOOKUP_FIELDS, values are dicts mapping a
+        # lowercase value to a list of package entries
+        self.lookups = dict([(field, {}) for field in LOOKUP_FIELDS])
+        # Paths of files that could not be parsed the last time they were
+        # indexed, which keep the entries from when they last could be
+        self.invalid = set()
+
+    def repository_paths(self):
+        """
+        :return:
+            A list of the paths of repository JSON files in the channel
+            folder, relative to the folder
+        """
+
+        paths = ['repository.json']
+        repository_folder = os.path.join(self.folder, 'repository')
+        if os.path.isdir(repository_folder):
+            for file_name in sorted(os.listdir(repository_folder)):
+                if file_name.endswith('.json'):
+                    paths.append('repository/' + file_name)
+        return paths
+
+    def update(self):
+        """
+        Re-indexes the repository files that were added, modified or removed
+        since the index was last updated
+
+        :return:
+            True if the index changed
+        """
+
+        changed = False
+        seen = set()
+
+        for path in self.repository_paths():
+            seen.add(path)
+            full_path = os.path.join(self.folder, path)
+            try:
+                mtime = os.path.getmtime(full_path)
+            except (OSError):
+                continue
+            if path in self.files and self.files[path]['mtime'] == mtime:
+                continue
+
+            packages = index_repository(full_path, path)
+            if packages is None:
+                # A file is usually invalid while it is being edited, so the
+                # packages in it should not disappear from conflict checks.
+                # The mtime is not updated, so it is parsed again next time.
+                self.invalid.add(path)
+                continue
+
+            self.invalid.discard(path)
+            self.remove_file(path)
+            self.add_file(path, mtime, packages)
+            changed = True
+
+        for path in list(self.files.keys()):
+            if path not in seen:
+                self.remove_file(path)
+                changed = True
+        self.invalid &= seen
+
+        return changed
+
+    def add_file(self, path, mtime, packages):
+        """
+        Adds the package entries of a repository file to the lookups
+        """
+
+        self.files[path] = {'mtime': mtime, 'packages': packages}
+        for entry in packages:
+            for field in LOOKUP_FIELDS:
+                for value in entry_values(entry, field):
+                    self.lookups[field].setdefault(lookup_key(field, value), []).append(entry)
+
+    def remove_file(self, path):
+        """
+        Removes the package entries of a repository file from the lookups
+        """
+
+        if path not in self.files:
+            return
+        for entry in self.files[path]['packages']:
+            for field in LOOKUP_FIELDS:
+                for value in entry_values(entry, field):
+                    key = lookup_key(field, value)
+                    matches = [match for match in self.lookups[field].get(key, []) if match is not entry]
+                    if matches:
+                        self.lookups[field][key] = matches
+                    else:
+                        self.lookups[field].pop(key, None)
+        del self.files[path]
+
+    def find(self, field, value):
+        """
+        Finds packages with a value for one of the indexed fields. Values
+        are compared case-insensitively, and details URLs ignore a trailing
+        slash.
+
+        :param field:
+            One of "name", "previous_names", "details" or "labels"
+
+        :param value:
+            The value to look for
+
+        :return:
+            A list of package entry dicts
+        """
+
+        return list(self.lookups[field].get(lookup_key(field, value), []))
+
+    def find_conflicts(self, name, exclude=None):
+        """
+        Finds packages that already use a name, either as their name or as a
+        previous name
+
+        :param name:
+            The package name to check
+
+        :param exclude:
+            An optional package entry dict to leave out of the result, so a
+            package does not conflict with itself, e.g. when it was renamed
+            only by case
+
+        :return:
+            A list of distinct package entry dicts
+        """
+
+        entries = self.find('name', name) + self.find('previous_names', name)
+        return [entry for entry in unique_entries(entries) if entry is not exclude]
+
+    def duplicates(self):
+        """
+        :return:
+            A dict with lowercase names as keys and lists of distinct package
+            entry dicts as values, for each name used by more than one package
+        """
+
+        result = {}
+        for key, entries in self.lookups['name'].items():
+            conflicts = unique_entries(entries + self.lookups['previous_names'].get(key, []))
+            if len(conflicts) > 1:
+                result[key] = conflicts
+        return result
+
+    def entries(self):
+        """
+        :return:
+            A list of every package entry dict, ordered by file
+        """
+
+        result = []
+        for path in sorted(self.files):
+            result.extend(self.files[path]['packages'])
+        return result
+
+    def to_json(self):
+        """
+        :return:
+            A JSON string of the index, for persisting to disk
+        """
+
+        return json.dumps({
+            'version': INDEX_VERSION,
+            'folder': self.folder,
+            'files': self.files
+        })
+
+    @classmethod
+    def from_json(cls, folder, json_string):
+        """
+        Restores an index persisted by to_json()
+
+        :return:
+            A PackageIndex, which is empty if the JSON is from another
+            version or folder
+        """
+
+        index = cls(folder)
+        data = json.loads(json_string)
+        if data.get('version') != INDEX_VERSION or data.get('folder') != folder:
+            return index
+        for path, info in data['files'].items():
+            index.add_file(path, info['mtime'], info['packages'])
+        return index
+
+
+def entry_values(entry, field):
+    """
+    Returns the values of an indexed field of a package entry as a list
+    """
+
+    value = entry.get(field)
+    if not isinstance(value, list):
+        value = [value]
+    return [item for item in value if isinstance(item, (str, type(u'')))]
+
+
+def unique_entries(entries):
+    """
+    Removes repeated package entries, which happen when a package matches a
+    lookup through more than one of its values
+
+    :param entries:
+        A list of package entry dicts
+
+    :return:
+        A list of the distinct entries, in order
+    """
+
+    result = []
+    seen = set()
+    for entry in entries:
+        if id(entry) not in seen:
+            seen.add(id(entry))
+            result.append(entry)
+    return result
+
+
+def lookup_key(field, value):
+    """
+    Normalizes a value of an indexed field for use as a lookup key
+    """
+
+    key = value.lower()
+    if field == 'details':
+        key = key.rstrip('/')
+    return key
+
+
+def index_repository(full_path, path):
+    """
+    Extracts the indexed fields from each package of a repository file
+
+    :param full_path:
+        The filesystem path to the repository JSON
+
+    :param path:
+        The path relative to the channel folder, stored in each entry
+
+    :return:
+        A list of package entry dicts with the keys "path", "line" and the
+        fields in LOOKUP_FIELDS that the package has, or None if the file
+        could not be read or parsed
+    """
+
+    try:
+        with open(full_path, 'rb') as f:
+            text = f.read().decode('utf-8')
+        repo = json.loads(text)
+        offsets = find_package_offsets(text)
+    except (IOError, OSError, ValueError):
+        return None
+
+    packages = repo.get('packages', [])
+    if len(offsets) != len(packages):
+        offsets = [(0, 0)] * len(packages)
+
+    entries = []
+    line = 1
+    last_offset = 0
+    for package, (start, end) in zip(packages, offsets):
+        line += text.count('\n', last_offset, start)
+        last_offset = start
+
+        entry = {'path': path, 'line': line}
+        for field in LOOKUP_FIELDS:
+            if field in package:
+                entry[field] = package[field]
+        entry['name'] = get_package_name(package)
+        entries.append(entry)
+
+    return entries
+
+
+def index_cache_path(folder):
+    """
+    :param folder:
+        The path to the package_control_channel folder
+
+    :return:
+        The path to persist the index of the folder to
+    """
+
+    folder_hash = hashlib.md5(folder.encode('utf-8')).hexdigest()
+    return os.path.join(get_cache_dir(), 'package_index-%s.json' % folder_hash)
+
+
+# Indexes that have been loaded, keyed by channel folder
+package_indexes = {}
+package_indexes_lock = threading.Lock()
+
+
+def get_package_index(folder):
+    """
+    Returns an up-to-date index of the packages in a channel folder. The
+    index is kept in memory and persisted to disk, and only repository files
+    that were modified since the last call are parsed again.
+
+    :param folder:
+        The path to the package_control_channel folder
+
+    :return:
+        A PackageIndex
+    """
+
+    with package_indexes_lock:
+        cache_path = index_cache_path(folder)
+        index = package_indexes.get(folder)
+
+        if index is None:
+            index = PackageIndex(folder)
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, 'rb') as f:
+                        index = PackageIndex.from_json(folder, f.read().decode('utf-8'))
+                except (ValueError, KeyError):
+                    pass
+            package_indexes[folder] = index
+
+        if index.update():
+            # The persisted index is only an optimization, so failing to
+            # write it is not an error
+            try:
+                cache_dir = os.path.dirname(cache_path)
+                if not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                with open(cache_path, 'wb') as f:
+                    f.write(index.to_json().encode('utf-8'))
+            except (IOError, OSError):
+                pass
+
+        return index
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+
+# Matches the tokens that affect the structure of a JSON document. Strings are
+# matched as a whole so that brackets inside of them are skipped over.
+_TEXT_TOKEN_REGEX = re.compile(u'"(?:[^"\\\\]|\\\\.)*"|[{}\\[\\]:]', re.S)
+_BYTES_TOKEN_REGEX = re.compile(b'"(?:[^"\\\\]|\\\\.)*"|[{}\\[\\]:]', re.S)
+
+
+def find_package_offsets(data):
+    """
+    Finds where each package object in the "packages" array of a repository
+    JSON document starts and ends, without decoding the document
+
+    :param data:
+        The repository JSON as a unicode string, or as a byte string or
+        mmap.mmap object of UTF-8. Offsets are in characters for unicode
+        strings, and in bytes otherwise.
+
+    :raises:
+        ValueError - when the document does not contain a "packages" array of
+        objects, or the brackets in it are unbalanced
+
+    :return:
+        A list of (start, end) tuples, where end is the offset just past the
+        closing } of the package
+    """
+
+    if isinstance(data, type(u'')):
+        token_regex = _TEXT_TOKEN_REGEX
+        quote, colon, open_object, close_object, open_array, close_array = u'":{}[]'
+        packages_key = u'"packages"'
+    else:
+        token_regex = _BYTES_TOKEN_REGEX
+        quote, colon, open_object, close_object, open_array, close_array = [
+            b'":{}[]'[i:i + 1] for i in range(6)]
+        packages_key = b'"packages"'
+
+    offsets = []
+    # The stack of open containers, so we know when the top-level object
+    # and the packages array are closed
+    stack = []
+    last_string = None
+    key = None
+    packages_depth = None
+    package_start = None
+
+    for match in token_regex.finditer(data):
+        token = match.group(0)
+        first = token[0:1]
+
+        if first == quote:
+            last_string = token
+            continue
+
+        if token == colon:
+            if len(stack) == 1:
+                key = last_string
+            last_string = None
+            continue
+
+        if token == open_object or token == open_array:
+            if packages_depth is None and len(stack) == 1 and token == open_array and key == packages_key:
+                packages_depth = len(stack) + 1
+            elif packages_depth is not None and len(stack) == packages_depth and token == open_object:
+                package_start = match.start()
+            elif packages_depth is not None and len(stack) == packages_depth:
+                raise ValueError('The "packages" array contains a value that is not an object')
+            stack.append(token)
+
+        else:
+            if not stack:
+                raise ValueError('The JSON contains an unbalanced %s' % token)
+            opener = stack.pop()
+            if (opener == open_object) != (token == close_object):
+                raise ValueError('The JSON contains a mismatched %s' % token)
+            if packages_depth is not None and len(stack) == packages_depth and package_start is not None:
+                offsets.append((package_start, match.end()))
+                package_start = None
+            elif packages_depth is not None and len(stack) == packages_depth - 1:
+                return offsets
+
+        last_string = None
+
+    raise ValueError('The JSON does not contain a "packages" array')
+
+
+def find_selected_packages(offsets, regions):
+    """
+    Determines which packages are touched by a set of selections
+
+    :param offsets:
+        A list of (start, end) tuples from find_package_offsets()
+
+    :param regions:
+        A list of (begin, end) tuples for the selections, sorted by begin.
+        An empty selection selects the package the cursor is inside of.
+
+    :return:
+        A list of indexes into offsets
+    """
+
+    indexes = []
+    i = 0
+    for begin, end in regions:
+        # Both lists are sorted, so packages before this selection can be
+        # skipped for all later selections too
+        while i < len(offsets) and offsets[i][1] < begin:
+            i += 1
+        j = i
+        while j < len(offsets) and offsets[j][0] <= end:
+            start, stop = offsets[j]
+            if begin == end or (begin < stop and end > start):
+                if not indexes or indexes[-1] != j:
+                    indexes.append(j)
+            j += 1
+
+    return indexes
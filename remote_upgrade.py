@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import re
+import sys
+import threading
+
+if sys.version_info >= (3,):
+    from urllib.request import urlopen, Request
+    from queue import Queue
+    from .upgrade import upgrade_repository, TagInstructions
+    from .tests import StringQueue, find_channel_folder, display_results
+else:
+    from urllib2 import urlopen, Request
+    from Queue import Queue
+    from upgrade import upgrade_repository, TagInstructions
+    from tests import StringQueue, find_channel_folder, display_results
+
+import sublime
+import sublime_plugin
+
+
+class UpgradeRemoteRepositoriesCommand(sublime_plugin.WindowCommand):
+
+    def run(self, urls=None, output_dir=None):
+        if urls is not None and output_dir is not None:
+            self.start(urls, output_dir)
+            return
+
+        def handle_urls(url_string):
+            urls = [url for url in re.split('[\\s,]+', url_string) if url]
+            if not urls:
+                folder = find_channel_folder(self.window)
+                if folder is None:
+                    sublime.error_message(u'ChannelRepositoryTools\n\nPlease ' +
+                        u'enter one or more URLs, or open the ' +
+                        u'package_control_channel folder to upgrade every ' +
+                        u'repository in its channel.json.')
+                    return
+                urls = channel_repository_urls(folder)
+
+            default_dir = os.path.join(os.path.expanduser('~'), 'upgraded_repositories')
+            self.window.show_input_panel('Output Directory', default_dir,
+                lambda output_dir: self.start(urls, output_dir), None, None)
+
+        self.window.show_input_panel('Repository URLs (leave empty for all in channel.json)',
+            '', handle_urls, None, None)
+
+    def start(self, urls, output_dir):
+        output_queue = StringQueue()
+        panel = self.window.get_output_panel('channel_repository_tools')
+        panel.settings().set('word_wrap', True)
+
+        self.window.run_command('show_panel', {'panel': 'output.channel_repository_tools'})
+        threading.Thread(target=display_results, args=('Remote Repository Upgrade', panel, output_queue)).start()
+
+        def run():
+            def progress(result, completed, total):
+                output_queue.write(u'[%d/%d] %s: %s\n' % (completed, total, result['status'], result['url']))
+
+            try:
+                report = upgrade_remote_repositories(urls, output_dir, progress=progress)
+                output_queue.write(u'\n' + format_report(report))
+            except (Exception) as e:
+                output_queue.write(u'\nUnable to upgrade the repositories: %s\n' % e)
+            finally:
+                output_queue.write(u'\x04')
+
+        threading.Thread(target=run).start()
+
+
+def channel_repository_urls(folder):
+    """
+    Reads the remote repository URLs from the channel.json of a channel
+
+    :param folder:
+        The path to the package_control_channel folder
+
+    :return:
+        A list of URLs. Repositories that are part of the channel folder are
+        not included.
+    """
+
+    with open(os.path.join(folder, 'channel.json'), 'rb') as f:
+        channel = json.loads(f.read().decode('utf-8'))
+
+    return [url for url in channel.get('repositories', []) if re.match('https?://', url)]
+
+
+def is_old_schema(schema_version):
+    """
+    Determines if a repository schema_version is older than 3.0.0
+
+    :param schema_version:
+        The schema_version string from a repository
+
+    :raises:
+        ValueError - when the schema_version is not a version number
+
+    :return:
+        A bool
+    """
+
+    parts = tuple([int(part) for part in str(schema_version).split('.')])
+    return parts < (3, 0, 0)
+
+
+def output_file_name(url, used_names):
+    """
+    Creates a unique file name to save the upgraded JSON of a URL to
+
+    :param url:
+        The URL of the repository
+
+    :param used_names:
+        A set of the file names that have already been used, which is
+        updated with the returned name
+
+    :return:
+        A file name
+    """
+
+    name = re.sub('^https?://', '', url)
+    name = re.sub('[^A-Za-z0-9._-]+', '_', name).strip('_')
+    if not name.endswith('.json'):
+        name += '.json'
+
+    base = name[0:-5]
+    number = 2
+    while name.lower() in used_names:
+        name = '%s-%d.json' % (base, number)
+        number += 1
+    used_names.add(name.lower())
+    return name
+
+
+def fetch_and_upgrade(url, output_path, timeout):
+    """
+    Downloads a repository and upgrades it if it uses a schema older than
+    3.0.0
+
+    :param url:
+        The URL of the repository
+
+    :param output_path:
+        The path to write the upgraded JSON to
+
+    :param timeout:
+        The number of seconds to wait for the download
+
+    :return:
+        A dict with the keys "url", "status", "schema_version", "packages",
+        "file", "extra", "tags" and "error". status is one of "upgraded",
+        "current" or "error". tags is the report() of the TagInstructions
+        of the upgrade.
+    """
+
+    result = {
+        'url': url,
+        'status': 'error',
+        'schema_version': None,
+        'packages': None,
+        'file': None,
+        'extra': None,
+        'tags': [],
+        'error': None
+    }
+
+    try:
+        request = Request(url, headers={'User-Agent': 'ChannelRepositoryTools'})
+        response = urlopen(request, timeout=timeout)
+        try:
+            json_string = response.read().decode('utf-8')
+        finally:
+            response.close()
+    except (Exception) as e:
+        result['error'] = u'Unable to download: %s' % e
+        return result
+
+    try:
+        repo = json.loads(json_string)
+        schema_version = repo['schema_version']
+        result['schema_version'] = schema_version
+        result['packages'] = len(repo.get('packages', []))
+        old_schema = is_old_schema(schema_version)
+    except (Exception):
+        result['error'] = u'The JSON is not a repository with a valid "schema_version"'
+        return result
+
+    if not old_schema:
+        result['status'] = 'current'
+        return result
+
+    # Any failure is recorded in the result, otherwise the worker thread would
+    # die and the report could not be completed
+    try:
+        create_tags = TagInstructions()
+        status, output, extra = upgrade_repository(json_string, create_tags=create_tags)
+        if status != 'success':
+            result['error'] = output
+            return result
+
+        with open(output_path, 'wb') as f:
+            f.write(output.encode('utf-8'))
+    except (Exception) as e:
+        result['error'] = u'Unable to upgrade: %s: %s' % (e.__class__.__name__, e)
+        return result
+
+    result['status'] = 'upgraded'
+    result['file'] = output_path
+    result['extra'] = extra
+    result['tags'] = create_tags.report()
+    return result
+
+
+def upgrade_remote_repositories(urls, output_dir, max_workers=8, timeout=30, progress=None):
+    """
+    Downloads a list of repositories concurrently, upgrades each one that
+    uses a schema older than 3.0.0 and writes the results to a folder. Does
+    not require the Sublime Text UI, so it may be called from the console.
+
+    :param urls:
+        A list of repository URLs
+
+    :param output_dir:
+        The folder to write the upgraded JSON files and report.json to. It
+        is created if it does not exist.
+
+    :param max_workers:
+        The maximum number of repositories to download at once
+
+    :param timeout:
+        The number of seconds to wait for each download
+
+    :param progress:
+        An optional callback that is called with the result dict of each
+        repository, the number completed so far and the total
+
+    :return:
+        A dict with the keys "repositories", a list of result dicts from
+        fetch_and_upgrade() in the order of urls, and "totals", a dict of
+        counts by status and by schema_version, plus the number of tags
+        that need to be created
+    """
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    used_names = set(['report.json'])
+    jobs = Queue()
+    for index, url in enumerate(urls):
+        jobs.put((index, url, os.path.join(output_dir, output_file_name(url, used_names))))
+
+    results = [None] * len(urls)
+    lock = threading.Lock()
+    completed = [0]
+
+    def worker():
+        while True:
+            index, url, output_path = jobs.get()
+            if url is None:
+                return
+            result = fetch_and_upgrade(url, output_path, timeout)
+            with lock:
+                results[index] = result
+                completed[0] += 1
+                if progress:
+                    progress(result, completed[0], len(urls))
+
+    num_workers = max(1, min(max_workers, len(urls)))
+    for _ in range(num_workers):
+        jobs.put((None, None, None))
+
+    threads = [threading.Thread(target=worker) for _ in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = {'status': {}, 'schema_version': {}, 'tags': 0}
+    for result in results:
+        totals['tags'] += sum([len(group['tags']) for group in result['tags']])
+        totals['status'][result['status']] = totals['status'].get(result['status'], 0) + 1
+        if result['schema_version'] is not None:
+            schema_version = str(result['schema_version'])
+            totals['schema_version'][schema_version] = totals['schema_version'].get(schema_version, 0) + 1
+
+    report = {'repositories': results, 'totals': totals}
+    with open(os.path.join(output_dir, 'report.json'), 'wb') as f:
+        f.write(json.dumps(report, indent="\t", ensure_ascii=False).encode('utf-8'))
+
+    return report
+
+
+def format_report(report):
+    """
+    Creates a human-readable summary of a report
+
+    :param report:
+        The dict from upgrade_remote_repositories()
+
+    :return:
+        A unicode string
+    """
+
+    totals = report['totals']
+    lines = [u'Repositories: %d' % len(report['repositories'])]
+    for status in ['upgraded', 'current', 'error']:
+        lines.append(u'  %s: %d' % (status.capitalize(), totals['status'].get(status, 0)))
+
+    lines.append(u'Tags to create: %d' % totals['tags'])
+
+    lines.append(u'')
+    lines.append(u'Schema versions:')
+    for schema_version in sorted(totals['schema_version']):
+        lines.append(u'  %s: %d' % (schema_version, totals['schema_version'][schema_version]))
+
+    errors = [result for result in report['repositories'] if result['status'] == 'error']
+    if errors:
+        lines.append(u'')
+        lines.append(u'Errors:')
+        for result in errors:
+            lines.append(u'  %s\n    %s' % (result['url'], result['error']))
+
+    return u'\n'.join(lines) + u'\n'
@@ -99,10 +99,7 @@ def create_resources(window):
     folder = find_channel_folder(window)
 
     if folder is None:
-        sublime.error_message(u'ChannelRepositoryTools\n\nPlease open the ' +
-            u'package_control_channel folder. It can be obtained by forking ' +
-            u'and then cloning your fork of ' +
-            u'https://github.com/wbond/package_control_channel.')
+        show_channel_folder_error()
         return (None, None, None, None)
 
     output_queue = StringQueue()
@@ -119,14 +116,55 @@ def create_resources(window):
         output_queue.write("\x04")
         os.chdir(old_path)
 
-    parent_module_info = imp.find_module('tests', ["."])
-    imp.load_module('package_control_channel.tests', *parent_module_info)
-    module_info = imp.find_module('test', ["./tests"])
-    tests = imp.load_module('package_control_channel.tests.test', *module_info)
+    tests = import_tests_module(folder)
 
     return (tests, panel, output_queue, on_done)
 
 
+def import_tests_module(folder):
+    """
+    Imports (or re-imports) the test module from the channel folder
+
+    :param folder:
+        The path to the package_control_channel folder
+
+    :return:
+        The module package_control_channel/tests/test.py
+    """
+
+    parent_module_info = imp.find_module('tests', [folder])
+    imp.load_module('package_control_channel.tests', *parent_module_info)
+    module_info = imp.find_module('test', [os.path.join(folder, 'tests')])
+    return imp.load_module('package_control_channel.tests.test', *module_info)
+
+
+# Test modules that are kept loaded between runs, keyed by channel folder
+warm_tests_modules = {}
+
+
+def load_tests_module(folder):
+    """
+    Returns the test module from the channel folder, only re-importing it if
+    tests/test.py has been modified since it was last loaded
+
+    :param folder:
+        The path to the package_control_channel folder
+
+    :return:
+        A tuple of (tests_module, modified_time)
+    """
+
+    modified_time = os.path.getmtime(os.path.join(folder, 'tests', 'test.py'))
+    if folder in warm_tests_modules:
+        tests, loaded_time = warm_tests_modules[folder]
+        if loaded_time == modified_time:
+            return (tests, loaded_time)
+
+    tests = import_tests_module(folder)
+    warm_tests_modules[folder] = (tests, modified_time)
+    return (tests, modified_time)
+
+
 def find_channel_folder(window):
     """
     Looks in the window to find the package_control_channel folder.
@@ -149,6 +187,18 @@ def find_channel_folder(window):
     return None
 
 
+def show_channel_folder_error():
+    """
+    Tells the user to open the package_control_channel folder, for commands
+    that require it
+    """
+
+    sublime.error_message(u'ChannelRepositoryTools\n\nPlease open the ' +
+        u'package_control_channel folder. It can be obtained by forking ' +
+        u'and then cloning your fork of ' +
+        u'https://github.com/wbond/package_control_channel.')
+
+
 def run_local_tests(tests, path, output_queue, on_done):
     """
     Runs tests for a repository on the local filesystem
@@ -3,481 +3,955 @@
 import re
 import json
 import sys
+import threading
 from operator import itemgetter
 
+if sys.version_info >= (3, 8):
+    # Plain dicts preserve insertion order and use less memory than the C
+    # OrderedDict, which matters when upgrading large repositories
+    ordered_dict = dict
+elif sys.version_info >= (3,):
+    from collections import OrderedDict as ordered_dict
+else:
+    from ordereddict import OrderedDict as ordered_dict
+
 if sys.version_info >= (3,):
-    from urllib.request import urlopen
-    from collections import OrderedDict
+    from .package_offsets import find_package_offsets, find_selected_packages
 else:
-    from urllib2 import urlopen
-    from ordereddict import OrderedDict
+    from package_offsets import find_package_offsets, find_selected_packages
 
 import sublime
 import sublime_plugin
 
 
-class UpgradeRepositorySchemaCommand(sublime_plugin.TextCommand):
+# The ids of views that currently have an upgrade running in the background
+upgrading_views = set()
 
-    def run(self, edit):
-        whole_file = sublime.Region(0, self.view.size())
-        text = self.view.substr(whole_file)
-        result, output, extra = self.upgrade_repository(text)
 
+class UpgradeRepositorySchemaCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit, selection_only=False):
+        view_id = self.view.id()
+        if view_id in upgrading_views:
+            sublime.status_message(u'ChannelRepositoryTools: an upgrade is already running for this view')
+            return
+
+        text = self.view.substr(sublime.Region(0, self.view.size()))
+        change_count = self.view.change_count()
+        regions = [(region.begin(), region.end()) for region in self.view.sel()]
+
+        upgrading_views.add(view_id)
+        args = (self.view, text, change_count, regions if selection_only else None)
+        threading.Thread(target=run_upgrade, args=args).start()
+
+
+class UpgradeRepositorySchemaApplyCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit, change_count, edits, extra=None, tags=None):
+        # The conversion ran in the background, so offsets are only valid if
+        # the view has not been modified since the text was read
+        if self.view.change_count() != change_count:
+            sublime.error_message(u'ChannelRepositoryTester\n\nThe view was ' +
+                u'modified while the upgrade was running, so the result was ' +
+                u'not applied. Please run the upgrade again.')
+            return
+
+        # Edits are applied from the end so earlier offsets remain valid
+        for start, end, new_text in reversed(edits):
+            self.view.replace(edit, sublime.Region(start, end), new_text)
+
+        if extra:
+            sublime.message_dialog(u'ChannelRepositoryTester\n\n' + extra)
+
+        if tags:
+            show_tag_report(self.view.window(), tags)
+
+
+def show_tag_report(window, report):
+    """
+    Shows the tags that need to be created as JSON in an output panel, so
+    they can be copied into scripts or other tools
+
+    :param window:
+        The sublime.Window to show the panel in
+
+    :param report:
+        The report() of a TagInstructions object
+    """
+
+    panel = window.get_output_panel('channel_repository_tools_tags')
+    panel.run_command('select_all')
+    panel.run_command('right_delete')
+    panel.run_command('channel_repository_tools_insert', {'string': json.dumps(report, indent="\t") + u'\n'})
+    window.run_command('show_panel', {'panel': 'output.channel_repository_tools_tags'})
+
+
+def run_upgrade(view, text, change_count, regions):
+    """
+    Upgrades the text of a view and then applies the result via the
+    upgrade_repository_schema_apply command. Runs in a background thread.
+
+    :param view:
+        The sublime.View being upgraded
+
+    :param text:
+        The contents of the view
+
+    :param change_count:
+        The change count of the view when the text was read
+
+    :param regions:
+        A list of (begin, end) tuples of the selections to upgrade, or None
+        to upgrade the whole view
+    """
+
+    status_key = 'channel_repository_tools_upgrade'
+    # Progress is only sent to the UI when the percentage changes, otherwise
+    # large repositories would flood the main thread with timeouts
+    last_percent = [None]
+
+    def progress(converted, total):
+        percent = (100 * converted) // total
+        if percent == last_percent[0]:
+            return
+        last_percent[0] = percent
+        message = u'Upgrading repository schema: %d of %d packages converted' % (converted, total)
+        # A whole-file upgrade still has to serialize the result once every
+        # package is converted, which takes a while for large repositories
+        if converted == total and regions is None:
+            message = u'Upgrading repository schema: formatting %d packages' % total
+        sublime.set_timeout(lambda: view.set_status(status_key, message), 0)
+
+    create_tags = TagInstructions()
+    try:
+        if regions is None:
+            result, output, extra = upgrade_repository(text, progress, create_tags)
+            if result == 'success':
+                output = [(0, len(text), output)]
+        else:
+            result, output, extra = upgrade_selected_packages(text, regions, progress, create_tags)
+    except (Exception) as e:
+        result, output, extra = ('error', u'An unexpected error occurred ' +
+            u'while upgrading the repository:\n\n%s: %s' % (e.__class__.__name__, e), None)
+    finally:
+        upgrading_views.discard(view.id())
+
+    def apply_result():
+        view.erase_status(status_key)
         if result == 'error':
             sublime.error_message(u'ChannelRepositoryTester\n\n' + output)
         elif result == 'message':
             sublime.message_dialog(u'ChannelRepositoryTester\n\n' + output)
         else:
-            self.view.replace(edit, whole_file, output)
-            if extra:
-                sublime.message_dialog(u'ChannelRepositoryTester\n\n' + extra)
+            view.run_command('upgrade_repository_schema_apply', {
+                'change_count': change_count,
+                'edits': output,
+                'extra': extra,
+                'tags': create_tags.report()
+            })
+
+    sublime.set_timeout(apply_result, 0)
+
+
+class TagInstructions(object):
+    """
+    An ordered set of the tags that need to be created for releases to be
+    found once a repository is upgraded, grouped by the host and user of the
+    repository they are for. Iterating yields the instructions to display,
+    one per distinct host, repository and version, in the order they were
+    added.
+    """
+
+    def __init__(self):
+        # Keys are (host, user) tuples, values are ordered dicts with
+        # (repository, version) keys and instruction values
+        self.groups = ordered_dict()
+        # Used as an ordered set of the distinct tags, with (host,
+        # repository, version) keys and instruction values
+        self.instructions = ordered_dict()
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __iter__(self):
+        return iter(list(self.instructions.values()))
+
+    def add(self, host, repository, version, instruction):
+        """
+        Records a tag that needs to be created
+
+        :param host:
+            The domain name of the host, e.g. "github.com"
+
+        :param repository:
+            The user and repository name, e.g. "wbond/package_control"
+
+        :param version:
+            The version to create a tag for
+
+        :param instruction:
+            The instruction to display to the user
+        """
+
+        user = repository.split('/')[0]
+        group = self.groups.setdefault((host, user), ordered_dict())
+        group[(repository, version)] = instruction
+        self.instructions[(host, repository, version)] = instruction
+
+    def add_github(self, repository, version):
+        """
+        Records a tag that needs to be created for a GitHub repository
+        """
+
+        self.add('github.com', repository, version,
+            'Create tag %s at https://github.com/%s/releases/new' % (version, repository))
+
+    def add_bitbucket(self, repository, version):
+        """
+        Records a tag that needs to be created for a BitBucket repository
+        """
+
+        self.add('bitbucket.org', repository, version,
+            'Create tag %s and push to BitBucket' % version)
+
+    def update(self, other):
+        """
+        Adds all of the tags from another TagInstructions object
 
-    def upgrade_repository(self, json_string):
+        :param other:
+            A TagInstructions object
         """
-        Takes an old repository JSON string and converts it to version 2.0.
 
-        :param json_string:
-            The JSON string to convert
+        for (host, user), group in other.groups.items():
+            for (repository, version), instruction in group.items():
+                self.add(host, repository, version, instruction)
 
+    def report(self):
+        """
         :return:
-            A tuple of (result, output, extra). The result may be 'error',
-            'message' or 'success'. If 'error' or 'message', the output is the
-            message. If the result is 'success', output is the new JSON. The extra
-            value is a string containing extra information about the output.
+            A list of dicts, one per host and user, with the keys "host",
+            "user" and "tags". "tags" is a list of dicts with the keys
+            "repository", "version" and "instruction".
         """
 
-        try:
-            repo = json.loads(json_string)
-        except (Exception) as e:
-            return ('error', u'The contents of the current view does not appear ' +
-                u'to be valid JSON.', None)
+        result = []
+        for (host, user), group in self.groups.items():
+            tags = []
+            for (repository, version), instruction in group.items():
+                tags.append({
+                    'repository': repository,
+                    'version': version,
+                    'instruction': instruction
+                })
+            result.append({'host': host, 'user': user, 'tags': tags})
+        return result
+
+
+def load_repository(json_string, mapping_class=ordered_dict):
+    """
+    Parses an old repository JSON string and makes sure it can be upgraded
+
+    :param json_string:
+        The JSON string to parse
+
+    :param mapping_class:
+        The ordered mapping type to decode objects to
+
+    :return:
+        A tuple of (repo, error). If the JSON can be upgraded, repo is the
+        parsed JSON and error is None. Otherwise repo is None and error is a
+        tuple in the same format as the return value of upgrade_repository().
+    """
+
+    try:
+        # Packages that are already upgraded are output as-is, so the order
+        # of their keys has to be kept
+        repo = json.loads(json_string, object_pairs_hook=mapping_class)
+    except (Exception) as e:
+        return (None, ('error', u'The contents of the current view does not appear ' +
+            u'to be valid JSON.', None))
+
+    if 'schema_version' not in repo:
+        return (None, ('error', u'The JSON does not have a "schema_version" key, ' +
+            u'and thus does not appear to be a repository file.', None))
+
+    if repo['schema_version'] == '3.0.0':
+        return (None, ('message', u'The JSON indicates it is using schema 3.0.0, ' +
+            u'thus it does not need to be upgraded.', None))
+
+    if 'packages' not in repo:
+        return (None, ('error', u'The JSON does not have a "packages" key, and ' +
+            u'thus does not appear to be a repository file.', None))
+
+    return (repo, None)
+
+
+def upgrade_repository(json_string, progress=None, create_tags=None, mapping_class=ordered_dict):
+    """
+    Takes an old repository JSON string and converts it to version 2.0.
+
+    :param json_string:
+        The JSON string to convert
+
+    :param progress:
+        An optional callback that is called with the number of packages
+        converted so far and the total number of packages
+
+    :param create_tags:
+        An optional TagInstructions object to collect the tags that need to
+        be created in, for a structured report
+
+    :param mapping_class:
+        The ordered mapping type to build the new JSON with, which defaults to
+        plain dicts on Python 3.8 and newer and OrderedDict otherwise
+
+    :return:
+        A tuple of (result, output, extra). The result may be 'error',
+        'message' or 'success'. If 'error' or 'message', the output is the
+        message. If the result is 'success', output is the new JSON. The extra
+        value is a string containing extra information about the output.
+    """
+
+    repo, error = load_repository(json_string, mapping_class)
+    if error:
+        return error
+
+    output = mapping_class()
+    output['schema_version'] = '3.0.0'
+    output['packages'] = []
+
+    has_download_specifics = False
+    if create_tags is None:
+        create_tags = TagInstructions()
+
+    total = len(repo['packages'])
+    for package in repo['packages']:
+        new_package, download_specifics = upgrade_package(package, repo['schema_version'],
+            create_tags, mapping_class)
+        has_download_specifics = has_download_specifics or download_specifics
+        output['packages'].append(new_package)
+        if progress:
+            progress(len(output['packages']), total)
+
+    extra = build_extra(create_tags, has_download_specifics, repo['schema_version'])
+
+    return ('success', format_json(output) + '\n', extra)
+
+
+def upgrade_selected_packages(json_string, regions, progress=None, create_tags=None):
+    """
+    Converts only the packages of an old repository JSON string that are
+    touched by a set of selections, so the rest of the text can be left as-is
+
+    :param json_string:
+        The JSON string to convert
+
+    :param regions:
+        A list of (begin, end) tuples of the selections, sorted by begin
+
+    :param progress:
+        An optional callback that is called with the number of packages
+        converted so far and the total number of selected packages
+
+    :param create_tags:
+        An optional TagInstructions object to collect the tags that need to
+        be created in, for a structured report
+
+    :return:
+        A tuple of (result, output, extra). If the result is 'success', output
+        is a list of (start, end, new_text) tuples of the edits to make, in
+        order. Otherwise the format is the same as upgrade_repository().
+    """
+
+    repo, error = load_repository(json_string)
+    if error:
+        return error
+
+    offsets = locate_packages(json_string, repo)
+    if offsets is None:
+        return ('error', u'Unable to determine the location of each package ' +
+            u'in the "packages" key.', None)
+
+    indexes = find_selected_packages(offsets, regions)
+    if not indexes:
+        return ('message', u'None of the selections are inside of a package.', None)
+
+    schema_version = repo['schema_version']
+
+    # Packages upgraded by an earlier run are left alone, since converting
+    # them again would discard their releases
+    indexes = [index for index in indexes if not is_upgraded_package(repo['packages'][index], schema_version)]
 
-        if 'schema_version' not in repo:
-            return ('error', u'The JSON does not have a "schema_version" key, ' +
-                u'and thus does not appear to be a repository file.', None)
+    if create_tags is None:
+        create_tags = TagInstructions()
+    has_download_specifics = False
+    edits = []
+    for index in indexes:
+        new_package, download_specifics = upgrade_package(repo['packages'][index],
+            schema_version, create_tags)
+        has_download_specifics = has_download_specifics or download_specifics
+        start, end = offsets[index]
+        edits.append((start, end, format_package(new_package)))
+        if progress:
+            progress(len(edits), len(indexes))
+
+    # Once every package is upgraded, possibly over several runs, the
+    # repository is too
+    selected = set(indexes)
+    remaining = [index for index in range(len(offsets)) if index not in selected and
+        not is_upgraded_package(repo['packages'][index], schema_version)]
+    if not remaining:
+        schema_edit = build_schema_version_edit(json_string, offsets)
+        if schema_edit:
+            edits.insert(0, schema_edit)
 
-        if repo['schema_version'] == '3.0.0':
-            return ('message', u'The JSON indicates it is using schema 3.0.0, ' +
-                u'thus it does not need to be upgraded.', None)
+    if not edits:
+        return ('message', u'The selected packages have already been upgraded.', None)
 
-        if 'packages' not in repo:
-            return ('error', u'The JSON does not have a "packages" key, and ' +
-                u'thus does not appear to be a repository file.', None)
+    extra = build_extra(create_tags, has_download_specifics, repo['schema_version'])
 
-        output = OrderedDict()
-        output['schema_version'] = '3.0.0'
-        output['packages'] = []
+    return ('success', edits, extra)
 
-        has_download_specifics = False
-        create_tags = []
 
-        for package in repo['packages']:
-            new_package = OrderedDict()
+def locate_packages(json_string, repo):
+    """
+    Finds the text of each package in a repository JSON string
 
-            if repo['schema_version'] != '2.0':
-                new_package['name'] = package.get('name', '')
+    :param json_string:
+        The JSON string the repository was parsed from
 
-                old_author = package.get('author', 'Unknown')
-                if old_author == "Your name or github username":
-                    old_author = 'Unknown'
-                old_homepage = package.get('homepage', '')
-                github_match = re.match('https?://github.com/([^/]+)/([^/]+)$', old_homepage, re.I)
-                bitbucket_match = re.match('https?://bitbucket.org/([^/]+)/([^/]+)$', old_homepage, re.I)
+    :param repo:
+        The parsed repository from load_repository()
 
-                if github_match or bitbucket_match:
-                    github_author_mismatch = github_match and github_match.group(1) != old_author
-                    bitbucket_author_mismatch = bitbucket_match and bitbucket_match.group(1) != old_author
-                    if (github_author_mismatch or bitbucket_author_mismatch) and old_author != 'Unknown':
-                        new_package['author'] = old_author
+    :return:
+        A list of (start, end) tuples, one per package, or None if the
+        packages could not be located
+    """
 
-                    new_package['details'] = old_homepage
+    try:
+        offsets = find_package_offsets(json_string)
+    except (ValueError):
+        return None
+    if len(offsets) != len(repo['packages']):
+        return None
+    return offsets
 
+
+def build_schema_version_edit(json_string, offsets):
+    """
+    Creates the edit that changes the "schema_version" of a repository JSON
+    string to 3.0.0, for when every package has been upgraded in place
+
+    :param json_string:
+        The repository JSON string
+
+    :param offsets:
+        A list of (start, end) tuples from locate_packages()
+
+    :return:
+        A (start, end, new_text) tuple, or None if the key was not found
+    """
+
+    prefix = json_string[0:offsets[0][0]] if offsets else json_string
+    schema_match = re.search('("schema_version"\s*:\s*)"[^"]*"', prefix)
+    if not schema_match:
+        return None
+    return (schema_match.start(0) + len(schema_match.group(1)), schema_match.end(0), '"3.0.0"')
+
+
+def is_upgraded_package(package, schema_version):
+    """
+    Determines if a package of an old repository is already in the 3.0.0
+    format, which happens when only some of the packages were upgraded in
+    place and the schema_version has not been changed yet
+
+    :param package:
+        A dict of the package info from the repository
+
+    :param schema_version:
+        The schema_version of the repository
+
+    :return:
+        A bool
+    """
+
+    if schema_version != '2.0':
+        return 'releases' in package and 'platforms' not in package
+
+    # Releases in schema 2.0 used "details" URLs instead of these keys
+    for release in package.get('releases', []):
+        if 'tags' in release or 'branch' in release or 'base' in release:
+            return True
+    return False
+
+
+def upgrade_package(package, schema_version, create_tags, mapping_class=ordered_dict):
+    """
+    Converts a single package from an old repository to schema 3.0.0.
+    Packages that are already in the 3.0.0 format are returned unchanged.
+
+    :param package:
+        A dict of the package info from the old repository
+
+    :param schema_version:
+        The schema_version of the old repository
+
+    :param create_tags:
+        A TagInstructions object that tags that need to be created are added to
+
+    :param mapping_class:
+        The ordered mapping type to build the new package with
+
+    :return:
+        A tuple of (new_package, has_download_specifics). has_download_specifics
+        is True if any release still has to be specified by version and URL.
+    """
+
+    if is_upgraded_package(package, schema_version):
+        has_download_specifics = any(['url' in release for release in package['releases']])
+        return (package, has_download_specifics)
+
+    has_download_specifics = False
+
+    new_package = mapping_class()
+
+    if schema_version != '2.0':
+        new_package['name'] = package.get('name', '')
+
+        old_author = package.get('author', 'Unknown')
+        if old_author == "Your name or github username":
+            old_author = 'Unknown'
+        old_homepage = package.get('homepage', '')
+        github_match = re.match('https?://github.com/([^/]+)/([^/]+)$', old_homepage, re.I)
+        bitbucket_match = re.match('https?://bitbucket.org/([^/]+)/([^/]+)$', old_homepage, re.I)
+
+        if github_match or bitbucket_match:
+            github_author_mismatch = github_match and github_match.group(1) != old_author
+            bitbucket_author_mismatch = bitbucket_match and bitbucket_match.group(1) != old_author
+            if (github_author_mismatch or bitbucket_author_mismatch) and old_author != 'Unknown':
+                new_package['author'] = old_author
+
+            new_package['details'] = old_homepage
+
+        else:
+            new_package['description'] = package.get('description', '')
+            new_package['author'] = old_author
+            new_package['homepage'] = old_homepage
+
+        new_package['releases'] = []
+
+        last_modified = package.get('last_modified', '2011-09-01 00:00:00')
+        for platform in package.get('platforms', {}):
+            old_releases = package['platforms'][platform]
+            for old_release in old_releases:
+                release = mapping_class()
+
+                if platform != '*':
+                    release['platforms'] = platform
+
+                release['sublime_text'] = '<3000'
+
+                old_url = old_release.get('url', '')
+                old_url = old_url.replace('://nodeload.github.com/', '://codeload.github.com/')
+                old_url = re.sub('^(https://codeload.github.com/[^/]+/[^/]+/)zipball(/.*)$', '\\1zip\\2', old_url)
+                old_version = old_release.get('version', '1.0.0')
+
+                # For some reason at least one user had an extra /tree segment in their URL
+                github_tag_match = re.match('https://codeload.github.com/([^/]+/[^/]+)(/tree)?/zip/v?' + re.escape(old_version) + '$', old_url)
+                # Alternate forms of the zip download URLs for GitHub
+                if not github_tag_match:
+                    github_tag_match = re.match('https://github.com/([^/]+/[^/]+)/archive/v?' + re.escape(old_version) + '.zip$', old_url)
+                if not github_tag_match:
+                    github_tag_match = re.match('https://github.com/([^/]+/[^/]+)/zipball/v?' + re.escape(old_version), old_url)
+
+                github_different_tag_match = re.match('https://codeload.github.com/([^/]+/[^/]+)/zip/v?[\d\._]+$', old_url)
+                if not github_different_tag_match:
+                    github_different_tag_match = re.match('https://github.com/([^/]+/[^/]+)/archive/v?[\d\._]+\.zip$', old_url)
+                if not github_different_tag_match:
+                    github_different_tag_match = re.match('https://github.com/([^/]+/[^/]+)/zipball/v?[\d\._]+$', old_url)
+
+                bitbucket_tag_match = re.match('https://bitbucket.org/([^/]+/[^/]+)/get/v?' + re.escape(old_version) + '\.zip$', old_url)
+
+                github_master_match = re.match('https://codeload.github.com/([^/]+/[^/]+)/zip/master$', old_url)
+                bitbucket_master_match = re.match('https://bitbucket.org/([^/]+/[^/]+)/get/(master|default)\.zip$', old_url)
+
+                fixed_version = None
+                if re.match('\d+\.\d+$', old_version):
+                    fixed_version = old_version + '.0'
                 else:
-                    new_package['description'] = package.get('description', '')
-                    new_package['author'] = old_author
-                    new_package['homepage'] = old_homepage
-
-                new_package['releases'] = []
-
-                last_modified = package.get('last_modified', '2011-09-01 00:00:00')
-                for platform in package.get('platforms', {}):
-                    old_releases = package['platforms'][platform]
-                    for old_release in old_releases:
-                        release = OrderedDict()
-
-                        if platform != '*':
-                            release['platforms'] = platform
-
-                        release['sublime_text'] = '<3000'
-
-                        old_url = old_release.get('url', '')
-                        old_url = old_url.replace('://nodeload.github.com/', '://codeload.github.com/')
-                        old_url = re.sub('^(https://codeload.github.com/[^/]+/[^/]+/)zipball(/.*)$', '\\1zip\\2', old_url)
-                        old_version = old_release.get('version', '1.0.0')
-
-                        # For some reason at least one user had an extra /tree segment in their URL
-                        github_tag_match = re.match('https://codeload.github.com/([^/]+/[^/]+)(/tree)?/zip/v?' + re.escape(old_version) + '$', old_url)
-                        # Alternate forms of the zip download URLs for GitHub
-                        if not github_tag_match:
-                            github_tag_match = re.match('https://github.com/([^/]+/[^/]+)/archive/v?' + re.escape(old_version) + '.zip$', old_url)
-                        if not github_tag_match:
-                            github_tag_match = re.match('https://github.com/([^/]+/[^/]+)/zipball/v?' + re.escape(old_version), old_url)
-
-                        github_different_tag_match = re.match('https://codeload.github.com/([^/]+/[^/]+)/zip/v?[\d\._]+$', old_url)
-                        if not github_different_tag_match:
-                            github_different_tag_match = re.match('https://github.com/([^/]+/[^/]+)/archive/v?[\d\._]+\.zip$', old_url)
-                        if not github_different_tag_match:
-                            github_different_tag_match = re.match('https://github.com/([^/]+/[^/]+)/zipball/v?[\d\._]+$', old_url)
-
-                        bitbucket_tag_match = re.match('https://bitbucket.org/([^/]+/[^/]+)/get/v?' + re.escape(old_version) + '\.zip$', old_url)
-
-                        github_master_match = re.match('https://codeload.github.com/([^/]+/[^/]+)/zip/master$', old_url)
-                        bitbucket_master_match = re.match('https://bitbucket.org/([^/]+/[^/]+)/get/(master|default)\.zip$', old_url)
-
-                        fixed_version = None
-                        if re.match('\d+\.\d+$', old_version):
-                            fixed_version = old_version + '.0'
-                        else:
-                            fixed_version = old_version
-                        semver_match = re.match('\d+\.\d+\.\d+$', fixed_version)
-
-                        base = None
-                        if semver_match and github_tag_match:
-                            base = 'https://github.com/' + github_tag_match.group(1)
-                            release['tags'] = True
-                            if fixed_version != old_version:
-                                release_instructions = 'Create tag %s at https://github.com/%s/releases/new' % (fixed_version, github_tag_match.group(1))
-                                if release_instructions not in create_tags:
-                                    create_tags.append(release_instructions)
-
-                        elif semver_match and github_different_tag_match:
-                            base = 'https://github.com/' + github_different_tag_match.group(1)
-                            release['tags'] = True
-                            release_instructions = 'Create tag %s at https://github.com/%s/releases/new' % (fixed_version, github_different_tag_match.group(1))
-                            if release_instructions not in create_tags:
-                                create_tags.append(release_instructions)
-
-                        elif semver_match and bitbucket_tag_match:
-                            base = 'https://bitbucket.org/' + bitbucket_tag_match.group(1)
-                            release['tags'] = True
-
-                        elif github_master_match:
-                            name_repo = github_master_match.group(1)
-                            base = 'https://github.com/' + name_repo
-                            release['tags'] = True
-                            release_instructions = 'Create tag %s at https://github.com/%s/releases/new' % (fixed_version, name_repo)
-                            if release_instructions not in create_tags:
-                                create_tags.append(release_instructions)
-
-                        elif bitbucket_master_match:
-                            base = 'https://bitbucket.org/' + bitbucket_master_match.group(1)
-                            release['tags'] = True
-                            create_tags.append('Create tag %s and push to BitBucket' % fixed_version)
-
-                        else:
-                            has_download_specifics = True
-                            release['version'] = old_version
-                            release['url'] = old_url
-                            release['date'] = last_modified
-
-                        if base and 'details' in new_package and base != new_package['details']:
-                            release['base'] = base
-
-                        new_package['releases'].append(release)
-            else:
-                for key in ['name', 'details', 'description', 'homepage', 'author', 'readme', 'issues', 'donate', 'buy', 'labels', 'previous_names']:
-                    if key in package:
-                        value = package[key]
-                        if key == 'details':
-                            value = value.rstrip('/')
-                        if 'details' in new_package:
-
-                            # Skip the homepage if it is the same URL as 'details'
-                            if key == 'homepage' and value == new_package['details']:
+                    fixed_version = old_version
+                semver_match = re.match('\d+\.\d+\.\d+$', fixed_version)
+
+                base = None
+                if semver_match and github_tag_match:
+                    base = 'https://github.com/' + github_tag_match.group(1)
+                    release['tags'] = True
+                    if fixed_version != old_version:
+                        create_tags.add_github(github_tag_match.group(1), fixed_version)
+
+                elif semver_match and github_different_tag_match:
+                    base = 'https://github.com/' + github_different_tag_match.group(1)
+                    release['tags'] = True
+                    create_tags.add_github(github_different_tag_match.group(1), fixed_version)
+
+                elif semver_match and bitbucket_tag_match:
+                    base = 'https://bitbucket.org/' + bitbucket_tag_match.group(1)
+                    release['tags'] = True
+
+                elif github_master_match:
+                    name_repo = github_master_match.group(1)
+                    base = 'https://github.com/' + name_repo
+                    release['tags'] = True
+                    create_tags.add_github(name_repo, fixed_version)
+
+                elif bitbucket_master_match:
+                    base = 'https://bitbucket.org/' + bitbucket_master_match.group(1)
+                    release['tags'] = True
+                    create_tags.add_bitbucket(bitbucket_master_match.group(1), fixed_version)
+
+                else:
+                    has_download_specifics = True
+                    release['version'] = old_version
+                    release['url'] = old_url
+                    release['date'] = last_modified
+
+                if base and 'details' in new_package and base != new_package['details']:
+                    release['base'] = base
+
+                new_package['releases'].append(release)
+    else:
+        for key in ['name', 'details', 'description', 'homepage', 'author', 'readme', 'issues', 'donate', 'buy', 'labels', 'previous_names']:
+            if key in package:
+                value = package[key]
+                if key == 'details':
+                    value = value.rstrip('/')
+                if 'details' in new_package:
+
+                    # Skip the homepage if it is the same URL as 'details'
+                    if key == 'homepage' and value == new_package['details']:
+                        continue
+
+                    # Skip default issues values
+                    if key == 'issues' and value == new_package['details'] + '/issues':
+                        continue
+
+                    # Cleanup variations on readme detection
+                    if key == 'readme':
+                        details_match = re.match('https://github.com/([^/]+/[^/]+)$', new_package['details'], re.I)
+                        if details_match:
+                            readme_regex = re.compile(re.escape(new_package['details']) + '/blob/master/readme(\.(md|mkd|mdown|markdown|textile|creole|rst))?$', re.I)
+                            if re.match(readme_regex, value):
+                                continue
+                            # https://raw.githubusercontent.com/Varriount/NimLime/master/readme.md
+                            readme_regex_2 = re.compile('https://raw.githubusercontent.com/' + re.escape(details_match.group(1)) + '/master/readme(\.(md|mkd|mdown|markdown|textile|creole|rst))?$', re.I)
+                            if re.match(readme_regex_2, value):
+                                continue
+                        elif re.match('https://bitbucket.org/[^/]+/[^/]+$', new_package['details'], re.I):
+                            readme_regex = re.compile(re.escape(new_package['details']) + '/(raw|src)/master/readme(\.(md|mkd|mdown|markdown|textile|creole|rst))?$', re.I)
+                            if re.match(readme_regex, value):
                                 continue
 
-                            # Skip default issues values
-                            if key == 'issues' and value == new_package['details'] + '/issues':
+                    # Clean up old gittip.com URLs since it is now gratipay.com
+                    if key == 'donate':
+                        details_match = re.match('https://github.com/([^/]+)/[^/]+$', new_package['details'], re.I)
+                        if details_match:
+                            username = details_match.group(1)
+                            gittip_url = 'https://www.gittip.com/%s/' % username
+                            if value == gittip_url:
                                 continue
 
-                            # Cleanup variations on readme detection
-                            if key == 'readme':
-                                details_match = re.match('https://github.com/([^/]+/[^/]+)$', new_package['details'], re.I)
-                                if details_match:
-                                    readme_regex = re.compile(re.escape(new_package['details']) + '/blob/master/readme(\.(md|mkd|mdown|markdown|textile|creole|rst))?$', re.I)
-                                    if re.match(readme_regex, value):
-                                        continue
-                                    # https://raw.githubusercontent.com/Varriount/NimLime/master/readme.md
-                                    readme_regex_2 = re.compile('https://raw.githubusercontent.com/' + re.escape(details_match.group(1)) + '/master/readme(\.(md|mkd|mdown|markdown|textile|creole|rst))?$', re.I)
-                                    if re.match(readme_regex_2, value):
-                                        continue
-                                elif re.match('https://bitbucket.org/[^/]+/[^/]+$', new_package['details'], re.I):
-                                    readme_regex = re.compile(re.escape(new_package['details']) + '/(raw|src)/master/readme(\.(md|mkd|mdown|markdown|textile|creole|rst))?$', re.I)
-                                    if re.match(readme_regex, value):
-                                        continue
-
-                            # Clean up old gittip.com URLs since it is now gratipay.com
-                            if key == 'donate':
-                                details_match = re.match('https://github.com/([^/]+)/[^/]+$', new_package['details'], re.I)
-                                if details_match:
-                                    username = details_match.group(1)
-                                    gittip_url = 'https://www.gittip.com/%s/' % username
-                                    if value == gittip_url:
-                                        continue
-
-                        new_package[key] = value
-
-                new_package['releases'] = []
-                for old_release in package.get('releases', {}):
-                    release = OrderedDict()
-
-                    for key in ['sublime_text', 'platforms']:
-                        if key in old_release:
-                            release[key] = old_release[key]
-
-                    if 'details' in old_release:
-                        details = old_release['details']
-
-                        github_base_match = re.match('https://github.com/([^/]+/[^/]+)$', details)
-                        bitbucket_base_match = re.match('https://bitbucket.org/([^/]+/[^/#]+)$', details)
-
-                        github_branch_match = re.match('https://github.com/([^/]+/[^/]+)/tree/(.+)$', details)
-                        bitbucket_branch_match = re.match('https://bitbucket.org/([^/]+/[^/]+)/src/(.+)$', details)
-
-                        github_tags_match = re.match('https://github.com/([^/]+/[^/]+)/tags$', details)
-                        bitbucket_tags_match = re.match('https://bitbucket.org/([^/]+/[^/#]+)#tags$', details)
-
-                        # We assign values to these vars so we can adds them
-                        # in order to the OrderedDict later
-                        base = None
-                        branch = None
-                        tags = None
-                        if github_base_match:
-                            base = 'https://github.com/' + github_base_match.group(1)
-                            branch = 'master'
-
-                        elif bitbucket_base_match:
-                            base = 'https://bitbucket.org/' + bitbucket_base_match.group(1)
-                            # This is not deterministic, but the default channel
-                            # didn't have an example of a base BitBucket URL anyway
-                            branch = 'default'
-
-                        elif github_branch_match:
-                            base = 'https://github.com/' + github_branch_match.group(1)
-                            branch = github_branch_match.group(2)
-
-                        elif bitbucket_branch_match:
-                            base = 'https://bitbucket.org/' + bitbucket_branch_match.group(1)
-                            branch = bitbucket_branch_match.group(2)
-
-                        elif github_tags_match:
-                            base = 'https://github.com/' + github_tags_match.group(1)
-                            tags = True
-
-                        elif bitbucket_tags_match:
-                            base = 'https://bitbucket.org/' + bitbucket_tags_match.group(1)
-                            tags = True
-
-                        if base and 'details' in new_package and base != new_package['details']:
-                            release['base'] = base
-                        if branch:
-                            release['branch'] = branch
-                        if tags:
-                            release['tags'] = tags
-
-                    for key in ['version', 'url', 'date']:
-                        if key in old_release:
-                            release[key] = old_release[key]
-
-                    new_package['releases'].append(release)
-
-                # Fill in master branch release for packages that ommited it
-                if 'releases' not in package:
-                    new_release = OrderedDict()
-                    new_release['sublime_text'] = '<3000'
-                    new_release['branch'] = 'master'
-                    new_package['releases'].append(new_release)
-
-            # Look through for releases that are the same other than the platform.
-            # This is usually for packages that work on Linux and OS X.
-            merged_releases = {}
-            unmerged_releases = []
-            for release in new_package['releases']:
-                if 'platforms' not in release:
-                    unmerged_releases.append(release)
-                    continue
-
-                platform = release['platforms']
-                sublime_text = release.get('sublime_text', '<3000')
-
-                if 'tags' in release:
-                    key = 'tags'
-                    if 'base' in release:
-                        key += '|%s' % release['base']
-                    key += '|%s' % sublime_text
-                elif 'branch' in release:
-                    key = 'branch|%s' % release['branch']
-                    if 'base' in release:
-                        key += '|%s' % release['base']
-                    key += '|%s' % sublime_text
-                else:
-                    key = "%s|%s|%s|%s" % (release['version'], release['url'], release['date'], sublime_text)
-
-                if key not in merged_releases:
-                    merged_releases[key] = []
-                merged_releases[key].append(platform)
-
-            if len(merged_releases) + len(unmerged_releases) != len(new_package['releases']):
-                all_versions = True
-                new_package['releases'] = unmerged_releases
-                for key in merged_releases:
-                    new_release = OrderedDict()
-
-                    new_release['platforms'] = sorted(merged_releases[key])
-                    # Only used temporarily for sorting releases
-                    new_release['platforms-sort'] = ','.join(new_release['platforms'])
-
-                    if len(new_release['platforms']) == 1:
-                        new_release['platforms'] = new_release['platforms'][0]
-
-                    key_parts = key.split('|')
-
-                    new_release['sublime_text'] = key_parts[-1]
-
-                    if key_parts[0] == 'tags':
-                        new_release['tags'] = True
-                        if len(key_parts) == 3:
-                            new_release['base'] = key_parts[1]
-                        all_versions = False
-                    if key_parts[0] == 'branch':
-                        new_release['branch'] = key_parts[1]
-                        if len(key_parts) == 4:
-                            new_release['base'] = key_parts[2]
-                        all_versions = False
-                    else:
-                        version = key_parts[0]
-                        url = key_parts[1]
-                        date = key_parts[2]
-                        new_release['version'] = version
-                        new_release['url'] = url
-                        new_release['date'] = date
-
-                    new_package['releases'].append(new_release)
-
-                if all_versions:
-                    new_package['releases'] = sorted(new_package['releases'], key=itemgetter('platforms-sort'))
-                    new_package['releases'] = sorted(new_package['releases'], key=itemgetter('version'), reverse=True)
-
-                for release in new_package['releases']:
-                    del release['platforms-sort']
-
-            sublime_text_fixes = {
-                # Consistency
-                '>2999':  '>=3000',
-                '<=2999': '<3000',
-                # Semantic mistakes
-                '>3000':  '>=3000',
-                '<=3000': '<3000'
-            }
-
-            # Clean up uncessaru platforms key
-            for release in new_package['releases']:
-                if 'platforms' not in release:
-                    continue
-
-                platforms = release['platforms']
-                if isinstance(platforms, list) and len(platforms) == 1:
-                    platforms = platforms[0]
-
-                # Remove the platforms key if all platforms are supported
-                if platforms == '*':
-                    del release['platforms']
-                elif 'linux' in platforms and 'windows' in platforms and 'osx' in platforms:
-                    del release['platforms']
-                # Convert single-item lists to a bare value
-                elif isinstance(release['platforms'], list) and not isinstance(platforms, list):
-                    release['platforms'] = platforms
-
-                if 'sublime_text' in release:
-                    if release['sublime_text'] in sublime_text_fixes:
-                        release['sublime_text'] = sublime_text_fixes[release['sublime_text']]
-
-            # We now support an array for the author key
-            if 'author' in new_package and new_package['author'].find(',') != -1:
-                new_package['author'] = re.split('\s*,\s*', new_package['author'])
-
-            output['packages'].append(new_package)
-
-        extra = None
-        if create_tags:
-            a = 'a ' if len(create_tags) == 1 else ''
-            plural = 's' if len(create_tags) > 1 else ''
-            extra = (u'This packages.json has been updated to ' + \
-                u'utilize features from schema_version 3.0.0 of Package Control ' + \
-                u'so any tags that are in the format MAJOR.MINOR.PATCH will ' + \
-                u'automatically be added as a release.\n\n' + \
-                u'Please perform the following operations to create ' + \
-                u'%stag%s for your release%s so that this new repository ' + \
-                u'JSON will properly expose your package downloads:\n\n%s' + \
-                u'\n\n' + \
-                u'To make future releases, simply create a new tag in your ' + \
-                u'repository in the format MAJOR.MINOR.PATCH. You will no ' + \
-                u'longer need to update this packages.json file.\n\n' + \
-                u'Since you no longer need to manually update this ' + \
-                u'packages.json file, the best place for package information ' + \
-                u'moving forward is the default Package Control repository ' + \
-                u'that is part of the default channel.\n\n' + \
-                u'Please consider adding the package information to the ' + \
-                u'appropriate JSON file in the ./repository/ folder of the ' + \
-                u'default channel and removing your repository URL from the ' + \
-                u'channel.json.') % (
-                a, plural, plural, '\n'.join(create_tags)
-                )
-
-        elif not has_download_specifics and repo['schema_version'] != '2.0':
-            extra = u'We‘ve detected that your package is currently using tags ' + \
-                u'for releases, great!\n\n' + \
-                u'This packages.json has been updated to ' + \
-                u'utilize features from schema_version 3.0.0 of Package Control ' + \
-                u'so any tags that are in the format MAJOR.MINOR.PATCH will ' + \
-                u'automatically be added as a release.\n\n' + \
-                u'To make future releases, simply create a new tag in your ' + \
-                u'repository in the format MAJOR.MINOR.PATCH. You will no ' + \
-                u'longer need to update this packages.json file.\n\n' + \
-                u'Since you no longer need to manually update this ' + \
-                u'packages.json file, the best place for package information ' + \
-                u'moving forward is the default Package Control repository ' + \
-                u'that is part of the default channel.\n\n' + \
-                u'Please consider adding the package information to the ' + \
-                u'appropriate JSON file in the ./repository/ folder of the ' + \
-                u'default channel and removing your repository URL from the ' + \
-                u'channel.json.'
-
-        json_output = json.dumps(output, indent="\t", ensure_ascii=False)
-
-        # Get rid of multi-line json arrays
-        def fold_multiline_array(matches, output):
-            for match in matches:
-                fixed_match = re.sub('\\[\\s*\n\\s*"', '["', match)
-                fixed_match = re.sub('"\\s*\n\s*\\]', '"]', fixed_match)
-                fixed_match = re.sub('",\\s*\n\\s*"', '", "', fixed_match)
-                output = output.replace(match, fixed_match)
-            return output
-
-        author_matches = re.findall('"author": \[.*?\]', json_output, re.S)
-        json_output = fold_multiline_array(author_matches, json_output)
-
-        platforms_matches = re.findall('"platforms": \[.*?\]', json_output, re.S)
-        json_output = fold_multiline_array(platforms_matches, json_output)
-
-        labels_matches = re.findall('"labels": \[.*?\]', json_output, re.S)
-        json_output = fold_multiline_array(labels_matches, json_output)
-
-        previous_names_matches = re.findall('"previous_names": \[.*?\]', json_output, re.S)
-        json_output = fold_multiline_array(previous_names_matches, json_output)
-
-        # Trim trailing whitespace
-        trailing_regex = re.compile('\s+$', re.M)
-        json_output = re.sub(trailing_regex, '', json_output)
-
-        return ('success', json_output + '\n', extra)
+                new_package[key] = value
+
+        new_package['releases'] = []
+        for old_release in package.get('releases', {}):
+            release = mapping_class()
+
+            for key in ['sublime_text', 'platforms']:
+                if key in old_release:
+                    release[key] = old_release[key]
+
+            if 'details' in old_release:
+                details = old_release['details']
+
+                github_base_match = re.match('https://github.com/([^/]+/[^/]+)$', details)
+                bitbucket_base_match = re.match('https://bitbucket.org/([^/]+/[^/#]+)$', details)
+
+                github_branch_match = re.match('https://github.com/([^/]+/[^/]+)/tree/(.+)$', details)
+                bitbucket_branch_match = re.match('https://bitbucket.org/([^/]+/[^/]+)/src/(.+)$', details)
+
+                github_tags_match = re.match('https://github.com/([^/]+/[^/]+)/tags$', details)
+                bitbucket_tags_match = re.match('https://bitbucket.org/([^/]+/[^/#]+)#tags$', details)
+
+                # We assign values to these vars so we can adds them
+                # in order to the ordered dict later
+                base = None
+                branch = None
+                tags = None
+                if github_base_match:
+                    base = 'https://github.com/' + github_base_match.group(1)
+                    branch = 'master'
+
+                elif bitbucket_base_match:
+                    base = 'https://bitbucket.org/' + bitbucket_base_match.group(1)
+                    # This is not deterministic, but the default channel
+                    # didn't have an example of a base BitBucket URL anyway
+                    branch = 'default'
+
+                elif github_branch_match:
+                    base = 'https://github.com/' + github_branch_match.group(1)
+                    branch = github_branch_match.group(2)
+
+                elif bitbucket_branch_match:
+                    base = 'https://bitbucket.org/' + bitbucket_branch_match.group(1)
+                    branch = bitbucket_branch_match.group(2)
+
+                elif github_tags_match:
+                    base = 'https://github.com/' + github_tags_match.group(1)
+                    tags = True
+
+                elif bitbucket_tags_match:
+                    base = 'https://bitbucket.org/' + bitbucket_tags_match.group(1)
+                    tags = True
+
+                if base and 'details' in new_package and base != new_package['details']:
+                    release['base'] = base
+                if branch:
+                    release['branch'] = branch
+                if tags:
+                    release['tags'] = tags
+
+            for key in ['version', 'url', 'date']:
+                if key in old_release:
+                    release[key] = old_release[key]
+
+            new_package['releases'].append(release)
+
+        # Fill in master branch release for packages that ommited it
+        if 'releases' not in package:
+            new_release = mapping_class()
+            new_release['sublime_text'] = '<3000'
+            new_release['branch'] = 'master'
+            new_package['releases'].append(new_release)
+
+    # Look through for releases that are the same other than the platform.
+    # This is usually for packages that work on Linux and OS X.
+    merged_releases = {}
+    unmerged_releases = []
+    for release in new_package['releases']:
+        if 'platforms' not in release:
+            unmerged_releases.append(release)
+            continue
+
+        platform = release['platforms']
+        sublime_text = release.get('sublime_text', '<3000')
+
+        if 'tags' in release:
+            key = 'tags'
+            if 'base' in release:
+                key += '|%s' % release['base']
+            key += '|%s' % sublime_text
+        elif 'branch' in release:
+            key = 'branch|%s' % release['branch']
+            if 'base' in release:
+                key += '|%s' % release['base']
+            key += '|%s' % sublime_text
+        else:
+            key = "%s|%s|%s|%s" % (release['version'], release['url'], release['date'], sublime_text)
+
+        if key not in merged_releases:
+            merged_releases[key] = []
+        merged_releases[key].append(platform)
+
+    if len(merged_releases) + len(unmerged_releases) != len(new_package['releases']):
+        all_versions = True
+        new_package['releases'] = unmerged_releases
+        for key in merged_releases:
+            new_release = mapping_class()
+
+            new_release['platforms'] = sorted(merged_releases[key])
+            # Only used temporarily for sorting releases
+            new_release['platforms-sort'] = ','.join(new_release['platforms'])
+
+            if len(new_release['platforms']) == 1:
+                new_release['platforms'] = new_release['platforms'][0]
+
+            key_parts = key.split('|')
+
+            new_release['sublime_text'] = key_parts[-1]
+
+            if key_parts[0] == 'tags':
+                new_release['tags'] = True
+                if len(key_parts) == 3:
+                    new_release['base'] = key_parts[1]
+                all_versions = False
+            elif key_parts[0] == 'branch':
+                new_release['branch'] = key_parts[1]
+                if len(key_parts) == 4:
+                    new_release['base'] = key_parts[2]
+                all_versions = False
+            else:
+                version = key_parts[0]
+                url = key_parts[1]
+                date = key_parts[2]
+                new_release['version'] = version
+                new_release['url'] = url
+                new_release['date'] = date
+
+            new_package['releases'].append(new_release)
+
+        if all_versions:
+            new_package['releases'] = sorted(new_package['releases'], key=itemgetter('platforms-sort'))
+            new_package['releases'] = sorted(new_package['releases'], key=itemgetter('version'), reverse=True)
+
+        for release in new_package['releases']:
+            del release['platforms-sort']
+
+    sublime_text_fixes = {
+        # Consistency
+        '>2999':  '>=3000',
+        '<=2999': '<3000',
+        # Semantic mistakes
+        '>3000':  '>=3000',
+        '<=3000': '<3000'
+    }
+
+    # Clean up uncessaru platforms key
+    for release in new_package['releases']:
+        if 'platforms' not in release:
+            continue
+
+        platforms = release['platforms']
+        if isinstance(platforms, list) and len(platforms) == 1:
+            platforms = platforms[0]
+
+        # Remove the platforms key if all platforms are supported
+        if platforms == '*':
+            del release['platforms']
+        elif 'linux' in platforms and 'windows' in platforms and 'osx' in platforms:
+            del release['platforms']
+        # Convert single-item lists to a bare value
+        elif isinstance(release['platforms'], list) and not isinstance(platforms, list):
+            release['platforms'] = platforms
+
+        if 'sublime_text' in release:
+            if release['sublime_text'] in sublime_text_fixes:
+                release['sublime_text'] = sublime_text_fixes[release['sublime_text']]
+
+    # We now support an array for the author key
+    if 'author' in new_package and new_package['author'].find(',') != -1:
+        new_package['author'] = re.split('\s*,\s*', new_package['author'])
+
+    return (new_package, has_download_specifics)
+
+
+def build_extra(create_tags, has_download_specifics, schema_version):
+    """
+    Builds the extra information to show to the user after an upgrade
+
+    :param create_tags:
+        A TagInstructions object
+
+    :param has_download_specifics:
+        If any release still has to be specified by version and URL
+
+    :param schema_version:
+        The schema_version of the old repository
+
+    :return:
+        A unicode string, or None
+    """
+
+    extra = None
+    if create_tags:
+        a = 'a ' if len(create_tags) == 1 else ''
+        plural = 's' if len(create_tags) > 1 else ''
+        extra = (u'This packages.json has been updated to ' + \
+            u'utilize features from schema_version 3.0.0 of Package Control ' + \
+            u'so any tags that are in the format MAJOR.MINOR.PATCH will ' + \
+            u'automatically be added as a release.\n\n' + \
+            u'Please perform the following operations to create ' + \
+            u'%stag%s for your release%s so that this new repository ' + \
+            u'JSON will properly expose your package downloads:\n\n%s' + \
+            u'\n\n' + \
+            u'To make future releases, simply create a new tag in your ' + \
+            u'repository in the format MAJOR.MINOR.PATCH. You will no ' + \
+            u'longer need to update this packages.json file.\n\n' + \
+            u'Since you no longer need to manually update this ' + \
+            u'packages.json file, the best place for package information ' + \
+            u'moving forward is the default Package Control repository ' + \
+            u'that is part of the default channel.\n\n' + \
+            u'Please consider adding the package information to the ' + \
+            u'appropriate JSON file in the ./repository/ folder of the ' + \
+            u'default channel and removing your repository URL from the ' + \
+            u'channel.json.') % (
+            a, plural, plural, '\n'.join(create_tags)
+            )
+
+    elif not has_download_specifics and schema_version != '2.0':
+        extra = u'We‘ve detected that your package is currently using tags ' + \
+            u'for releases, great!\n\n' + \
+            u'This packages.json has been updated to ' + \
+            u'utilize features from schema_version 3.0.0 of Package Control ' + \
+            u'so any tags that are in the format MAJOR.MINOR.PATCH will ' + \
+            u'automatically be added as a release.\n\n' + \
+            u'To make future releases, simply create a new tag in your ' + \
+            u'repository in the format MAJOR.MINOR.PATCH. You will no ' + \
+            u'longer need to update this packages.json file.\n\n' + \
+            u'Since you no longer need to manually update this ' + \
+            u'packages.json file, the best place for package information ' + \
+            u'moving forward is the default Package Control repository ' + \
+            u'that is part of the default channel.\n\n' + \
+            u'Please consider adding the package information to the ' + \
+            u'appropriate JSON file in the ./repository/ folder of the ' + \
+            u'default channel and removing your repository URL from the ' + \
+            u'channel.json.'
+
+    return extra
+
+
+def format_json(value):
+    """
+    Serializes upgraded repository info in the style of the default channel
+
+    :param value:
+        The repository or package info to serialize
+
+    :return:
+        A unicode string of JSON
+    """
+
+    json_output = json.dumps(value, indent="\t", ensure_ascii=False)
+
+    # Get rid of multi-line json arrays. Each array is replaced where it was
+    # matched, since replacing every match throughout the output is
+    # quadratic in the number of packages.
+    def fold_multiline_array(match):
+        fixed_match = re.sub('\\[\\s*\n\\s*"', '["', match.group(0))
+        fixed_match = re.sub('"\\s*\n\s*\\]', '"]', fixed_match)
+        fixed_match = re.sub('",\\s*\n\\s*"', '", "', fixed_match)
+        return fixed_match
+
+    for key in ['author', 'platforms', 'labels', 'previous_names']:
+        array_regex = re.compile('"%s": \\[.*?\\]' % key, re.S)
+        json_output = array_regex.sub(fold_multiline_array, json_output)
+
+    # Trim trailing whitespace
+    trailing_regex = re.compile('\s+$', re.M)
+    json_output = re.sub(trailing_regex, '', json_output)
+
+    return json_output
+
+
+def format_package(new_package):
+    """
+    Serializes an upgraded package so it can be placed directly into the
+    "packages" key of a repository formatted by format_json()
+
+    :param new_package:
+        The package info from upgrade_package()
+
+    :return:
+        A unicode string of JSON
+    """
+
+    return format_json(new_package).replace('\n', '\n\t\t')
@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except (ImportError):
+    # Only available on Python 3.4 and newer
+    tracemalloc = None
+
+if sys.version_info >= (3,):
+    from collections import OrderedDict
+    from .upgrade import upgrade_repository
+    from .tests import StringQueue, display_results
+    from .helpers import get_cache_dir
+else:
+    from ordereddict import OrderedDict
+    from upgrade import upgrade_repository
+    from tests import StringQueue, display_results
+    from helpers import get_cache_dir
+
+import sublime
+import sublime_plugin
+
+
+# The fraction that throughput may drop below the baseline before failing
+DEFAULT_THRESHOLD = 0.2
+
+# The minimum number of seconds to spend converting the corpus when
+# measuring throughput, so that small corpora still give stable numbers
+MIN_BENCHMARK_TIME = 2.0
+
+# The number of packages in the repositories built from the corpus for
+# measuring throughput at scale and comparing the plain dict and
+# OrderedDict upgrade engines
+LARGE_REPOSITORY_PACKAGES = 5000
+
+# Bump when what is timed changes, so older baselines are recorded again
+# instead of being compared to numbers measured differently
+BASELINE_VERSION = 2
+
+
+class RunUpgradeCorpusCommand(sublime_plugin.WindowCommand):
+
+    def run(self, corpus_dir=None, threshold=DEFAULT_THRESHOLD, update_baseline=False):
+        if corpus_dir is None:
+            corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upgrade_corpus')
+
+        if not os.path.isdir(corpus_dir):
+            sublime.error_message(u'ChannelRepositoryTools\n\nThe upgrade ' +
+                u'corpus folder %s does not exist. If this package is installed ' % corpus_dir +
+                u'as a .sublime-package file, pass the "corpus_dir" argument ' +
+                u'to point to a copy of the upgrade_corpus folder.')
+            return
+
+        output_queue = StringQueue()
+        panel = self.window.get_output_panel('channel_repository_tools')
+        panel.settings().set('word_wrap', True)
+
+        self.window.run_command('show_panel', {'panel': 'output.channel_repository_tools'})
+        threading.Thread(target=display_results, args=('Upgrade Corpus', panel, output_queue)).start()
+
+        def run():
+            try:
+                report = run_corpus(corpus_dir, baseline_path(), threshold, update_baseline)
+                output_queue.write(format_report(report))
+            except (Exception) as e:
+                output_queue.write(u'Unable to check the upgrade corpus: %s: %s\n' % (e.__class__.__name__, e))
+            finally:
+                output_queue.write(u'\x04')
+
+        threading.Thread(target=run).start()
+
+
+class BenchmarkUpgradeMappingCommand(sublime_plugin.WindowCommand):
+
+    def run(self, corpus_dir=None, num_packages=LARGE_REPOSITORY_PACKAGES):
+        if sys.version_info < (3, 8):
+            sublime.error_message(u'ChannelRepositoryTools\n\nThe plain ' +
+                u'dict upgrade engine is only used with Python 3.8 and newer, ' +
+                u'so there is nothing to compare with this version of ' +
+                u'Sublime Text.')
+            return
+
+        if corpus_dir is None:
+            corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upgrade_corpus')
+
+        if not os.path.isdir(corpus_dir):
+            sublime.error_message(u'ChannelRepositoryTools\n\nThe upgrade ' +
+                u'corpus folder %s does not exist. If this package is installed ' % corpus_dir +
+                u'as a .sublime-package file, pass the "corpus_dir" argument ' +
+                u'to point to a copy of the upgrade_corpus folder.')
+            return
+
+        output_queue = StringQueue()
+        panel = self.window.get_output_panel('channel_repository_tools')
+        panel.settings().set('word_wrap', True)
+
+        self.window.run_command('show_panel', {'panel': 'output.channel_repository_tools'})
+        threading.Thread(target=display_results, args=('Upgrade Engine Benchmark', panel, output_queue)).start()
+
+        def run():
+            try:
+                repositories = build_large_repositories(load_corpus(corpus_dir), num_packages)
+                results = compare_mapping_classes(repositories)
+                output_queue.write(format_comparison(results))
+            except (Exception) as e:
+                output_queue.write(u'Unable to benchmark the upgrade engine: %s: %s\n' % (e.__class__.__name__, e))
+            finally:
+                output_queue.write(u'\x04')
+
+        threading.Thread(target=run).start()
+
+
+def baseline_path():
+    """
+    :return:
+        The path of the file the throughput baseline of this machine is
+        stored in
+    """
+
+    return os.path.join(get_cache_dir(), 'upgrade_baseline.json')
+
+
+def load_corpus(corpus_dir):
+    """
+    Reads the repository files of a corpus and their expected upgrades
+
+    :param corpus_dir:
+        A folder with an "input" folder of old repository JSON files and an
+        "expected" folder. For each input file, the expected folder contains
+        a file with the same name of the expected JSON, and a .extra.txt
+        file of the expected extra information if there is any.
+
+    :return:
+        A list of dicts with the keys "name", "input", "expected",
+        "expected_extra" and "packages"
+    """
+
+    corpus = []
+    input_dir = os.path.join(corpus_dir, 'input')
+    expected_dir = os.path.join(corpus_dir, 'expected')
+
+    for file_name in sorted(os.listdir(input_dir)):
+        if not file_name.endswith('.json'):
+            continue
+
+        with open(os.path.join(input_dir, file_name), 'rb') as f:
+            input_json = f.read().decode('utf-8')
+
+        expected_path = os.path.join(expected_dir, file_name)
+        expected = None
+        if os.path.exists(expected_path):
+            with open(expected_path, 'rb') as f:
+                expected = f.read()
+
+        extra_path = os.path.join(expected_dir, file_name[0:-5] + '.extra.txt')
+        expected_extra = None
+        if os.path.exists(extra_path):
+            with open(extra_path, 'rb') as f:
+                expected_extra = f.read()
+
+        corpus.append({
+            'name': file_name,
+            'input': input_json,
+            'expected': expected,
+            'expected_extra': expected_extra,
+            'packages': len(json.loads(input_json).get('packages', []))
+        })
+
+    return corpus
+
+
+def first_difference(expected, actual):
+    """
+    Describes the first line that differs between two byte strings
+
+    :return:
+        A unicode string
+    """
+
+    expected_lines = expected.decode('utf-8').split(u'\n')
+    actual_lines = actual.decode('utf-8').split(u'\n')
+    for number in range(max(len(expected_lines), len(actual_lines))):
+        expected_line = expected_lines[number] if number < len(expected_lines) else u'<end of file>'
+        actual_line = actual_lines[number] if number < len(actual_lines) else u'<end of file>'
+        if expected_line != actual_line:
+            return u'line %d: expected %r, got %r' % (number + 1, expected_line, actual_line)
+    return u'no difference'
+
+
+def peak_memory(corpus):
+    """
+    Upgrades the files of a corpus once while tracing allocations, so the
+    memory used by the upgrader is measured separately from the rest of the
+    plugin host
+
+    :param corpus:
+        A list from load_corpus()
+
+    :return:
+        The peak number of kilobytes allocated, or None if tracemalloc is not
+        available
+    """
+
+    if tracemalloc is None:
+        return None
+
+    tracemalloc.start()
+    try:
+        for entry in corpus:
+            upgrade_repository(entry['input'])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak // 1024
+
+
+def check_corpus(corpus):
+    """
+    Upgrades each file of a corpus and compares the result byte-for-byte
+    with the expected output
+
+    :param corpus:
+        A list from load_corpus()
+
+    :return:
+        A list of unicode strings describing each mismatch
+    """
+
+    mismatches = []
+    for entry in corpus:
+        result, output, extra = upgrade_repository(entry['input'])
+        if result != 'success':
+            mismatches.append(u'%s: upgrade returned %s: %s' % (entry['name'], result, output))
+            continue
+
+        output = output.encode('utf-8')
+        if entry['expected'] is None:
+            mismatches.append(u'%s: no expected output' % entry['name'])
+        elif output != entry['expected']:
+            mismatches.append(u'%s: output %s' % (entry['name'], first_difference(entry['expected'], output)))
+
+        extra = extra.encode('utf-8') if extra else None
+        if extra != entry['expected_extra']:
+            if extra is None or entry['expected_extra'] is None:
+                difference = u'expected %s extra information' % (u'no' if extra else u'some')
+            else:
+                difference = first_difference(entry['expected_extra'], extra)
+            mismatches.append(u'%s: extra %s' % (entry['name'], difference))
+
+    return mismatches
+
+
+def large_repository_entries(corpus, num_packages=LARGE_REPOSITORY_PACKAGES):
+    """
+    Builds large repositories from a corpus, so throughput is also measured
+    where costs that grow faster than the number of packages show up
+
+    :param corpus:
+        A list from load_corpus()
+
+    :param num_packages:
+        The minimum number of packages for each repository
+
+    :return:
+        A list of dicts with the keys "input" and "packages"
+    """
+
+    entries = []
+    for repository in build_large_repositories(corpus, num_packages):
+        entries.append({
+            'input': repository,
+            'packages': len(json.loads(repository)['packages'])
+        })
+    return entries
+
+
+def measure_throughput(corpus, min_time=MIN_BENCHMARK_TIME, min_passes=3):
+    """
+    Repeatedly upgrades the files of a corpus to measure throughput. The
+    fastest pass is used, like timeit does, since slower passes are caused
+    by other work in the process, such as garbage collection of earlier
+    passes.
+
+    :param corpus:
+        A list from load_corpus() or large_repository_entries()
+
+    :param min_time:
+        The minimum number of seconds to spend upgrading
+
+    :param min_passes:
+        The minimum number of times to upgrade every file
+
+    :return:
+        The number of packages upgraded per second
+    """
+
+    packages = sum([entry['packages'] for entry in corpus])
+    fastest = None
+    passes = 0
+    start = time.time()
+    while passes < min_passes or time.time() - start < min_time:
+        pass_start = time.time()
+        for entry in corpus:
+            upgrade_repository(entry['input'])
+        elapsed = time.time() - pass_start
+        if fastest is None or elapsed < fastest:
+            fastest = elapsed
+        passes += 1
+
+    return packages / max(fastest, 1e-9)
+
+
+def run_corpus(corpus_dir, baseline_file, threshold=DEFAULT_THRESHOLD, update_baseline=False):
+    """
+    Checks the output of the upgrader against a golden corpus and compares
+    throughput to the baseline recorded for this machine
+
+    :param corpus_dir:
+        The folder of the corpus, see load_corpus()
+
+    :param baseline_file:
+        The path of the JSON file the baseline is stored in. If it does not
+        exist, the results of this run are stored as the baseline.
+
+    :param threshold:
+        The fraction throughput may drop below the baseline before the run
+        fails
+
+    :param update_baseline:
+        If the results of this run should replace the stored baseline. The
+        baseline is never updated when the output does not match.
+
+    :return:
+        A dict with the keys "files", "packages", "mismatches",
+        "packages_per_second", "large_packages",
+        "large_packages_per_second", "peak_memory", "baseline", "threshold",
+        "regressed" and "passed"
+    """
+
+    corpus = load_corpus(corpus_dir)
+    mismatches = check_corpus(corpus)
+    packages_per_second = measure_throughput(corpus)
+
+    large_corpus = large_repository_entries(corpus)
+    large_packages_per_second = measure_throughput(large_corpus)
+
+    baseline = None
+    if os.path.exists(baseline_file):
+        with open(baseline_file, 'rb') as f:
+            baseline = json.loads(f.read().decode('utf-8'))
+        if baseline.get('version') != BASELINE_VERSION:
+            baseline = None
+
+    regressed = False
+    if baseline and not update_baseline:
+        minimum = 1 - threshold
+        regressed = packages_per_second < baseline['packages_per_second'] * minimum or \
+            large_packages_per_second < baseline['large_packages_per_second'] * minimum
+
+    report = {
+        'files': len(corpus),
+        'packages': sum([entry['packages'] for entry in corpus]),
+        'mismatches': mismatches,
+        'packages_per_second': packages_per_second,
+        'large_packages': sum([entry['packages'] for entry in large_corpus]),
+        'large_packages_per_second': large_packages_per_second,
+        'peak_memory': peak_memory(corpus),
+        'baseline': baseline,
+        'threshold': threshold,
+        'regressed': regressed,
+        'passed': not mismatches and not regressed
+    }
+
+    if (baseline is None or update_baseline) and not mismatches:
+        baseline_dir = os.path.dirname(baseline_file)
+        if not os.path.exists(baseline_dir):
+            os.makedirs(baseline_dir)
+        with open(baseline_file, 'wb') as f:
+            new_baseline = {
+                'version': BASELINE_VERSION,
+                'packages_per_second': packages_per_second,
+                'large_packages_per_second': large_packages_per_second,
+                'peak_memory': report['peak_memory'],
+                'recorded': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            f.write(json.dumps(new_baseline, indent="\t").encode('utf-8'))
+        report['baseline'] = new_baseline
+
+    return report
+
+
+def format_report(report):
+    """
+    Creates a human-readable summary of a report from run_corpus()
+
+    :return:
+        A unicode string
+    """
+
+    lines = [u'Corpus: %d files, %d packages' % (report['files'], report['packages'])]
+
+    if report['mismatches']:
+        lines.append(u'Output: %d mismatch%s' % (len(report['mismatches']),
+            u'' if len(report['mismatches']) == 1 else u'es'))
+        for mismatch in report['mismatches']:
+            lines.append(u'  ' + mismatch)
+    else:
+        lines.append(u'Output: identical')
+
+    lines.append(u'Throughput: %.0f packages/sec' % report['packages_per_second'])
+    lines.append(u'Large repositories (%d packages): %.0f packages/sec' % (
+        report['large_packages'], report['large_packages_per_second']))
+    if report['peak_memory'] is not None:
+        lines.append(u'Peak allocated: %d KB' % report['peak_memory'])
+
+    baseline = report['baseline']
+    if baseline:
+        lines.append(u'Baseline recorded %s, threshold -%.0f%%:' % (baseline['recorded'], report['threshold'] * 100))
+        for label, key in [(u'Corpus', 'packages_per_second'), (u'Large repositories', 'large_packages_per_second')]:
+            change = (report[key] / baseline[key] - 1) * 100
+            lines.append(u'  %s: %.0f packages/sec (%+.1f%%)' % (label, baseline[key], change))
+
+    if report['regressed']:
+        lines.append(u'Throughput regressed beyond the threshold')
+
+    lines.append(u'')
+    lines.append(u'PASSED' if report['passed'] else u'FAILED')
+    return u'\n'.join(lines) + u'\n'
+
+
+def build_large_repositories(corpus, num_packages=LARGE_REPOSITORY_PACKAGES):
+    """
+    Builds large repositories by repeating the packages of a corpus, with a
+    number appended to the name of each copy
+
+    :param corpus:
+        A list from load_corpus()
+
+    :param num_packages:
+        The minimum number of packages for each repository
+
+    :return:
+        A list of JSON strings, one per schema_version in the corpus
+    """
+
+    packages_by_schema = OrderedDict()
+    for entry in corpus:
+        repo = json.loads(entry['input'])
+        packages_by_schema.setdefault(repo['schema_version'], []).extend(repo.get('packages', []))
+
+    repositories = []
+    for schema_version, packages in packages_by_schema.items():
+        if not packages:
+            continue
+        large_packages = []
+        copy = 1
+        while len(large_packages) < num_packages:
+            for package in packages:
+                package = dict(package)
+                if 'name' in package:
+                    package['name'] = u'%s %d' % (package['name'], copy)
+                large_packages.append(package)
+            copy += 1
+        repositories.append(json.dumps({'schema_version': schema_version, 'packages': large_packages}))
+
+    return repositories
+
+
+def compare_mapping_classes(repositories, repeat=3):
+    """
+    Upgrades repositories with the plain dict engine used on Python 3.8 and
+    newer, and with the OrderedDict engine used on older versions, to show
+    the difference in time and memory. The mapping class is passed to each
+    upgrade, so upgrades running in other threads are not affected.
+
+    :param repositories:
+        A list of JSON strings from build_large_repositories()
+
+    :param repeat:
+        The number of times to time each engine, the fastest is used
+
+    :return:
+        A dict with the keys "packages", "identical" and "engines". engines
+        is a dict with the keys "OrderedDict" and "dict", whose values are
+        dicts with the keys "seconds" and "peak_memory". peak_memory is in
+        bytes, or None if tracemalloc is not available.
+    """
+
+    packages = sum([len(json.loads(repository)['packages']) for repository in repositories])
+    engines = {}
+    outputs = {}
+
+    for label, mapping_class in [('OrderedDict', OrderedDict), ('dict', dict)]:
+        best = None
+        for _ in range(repeat):
+            start = time.time()
+            for repository in repositories:
+                upgrade_repository(repository, mapping_class=mapping_class)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        peak_memory = None
+        if tracemalloc is not None:
+            tracemalloc.start()
+            outputs[label] = [upgrade_repository(repository, mapping_class=mapping_class) for repository in repositories]
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            outputs[label] = [upgrade_repository(repository, mapping_class=mapping_class) for repository in repositories]
+
+        engines[label] = {'seconds': best, 'peak_memory': peak_memory}
+
+    return {
+        'packages': packages,
+        'identical': outputs['OrderedDict'] == outputs['dict'],
+        'engines': engines
+    }
+
+
+def format_comparison(results):
+    """
+    Creates a human-readable summary of the results of
+    compare_mapping_classes()
+
+    :return:
+        A unicode string
+    """
+
+    lines = [u'Packages per run: %d' % results['packages']]
+    for label in ['OrderedDict', 'dict']:
+        engine = results['engines'][label]
+        line = u'%s: %.3fs, %.0f packages/sec' % (label, engine['seconds'],
+            results['packages'] / engine['seconds'])
+        if engine['peak_memory'] is not None:
+            line += u', peak allocated %.1f MB' % (engine['peak_memory'] / 1048576.0)
+        lines.append(line)
+
+    legacy = results['engines']['OrderedDict']
+    fast = results['engines']['dict']
+    lines.append(u'')
+    lines.append(u'Time saved: %.1f%%' % ((1 - fast['seconds'] / legacy['seconds']) * 100))
+    if legacy['peak_memory'] and fast['peak_memory'] is not None:
+        lines.append(u'Peak allocation saved: %.1f%%' % ((1 - float(fast['peak_memory']) / legacy['peak_memory']) * 100))
+    lines.append(u'Output: %s' % (u'identical' if results['identical'] else u'DIFFERENT'))
+    return u'\n'.join(lines) + u'\n'
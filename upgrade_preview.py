@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+
+import sublime
+import sublime_plugin
+
+if sys.version_info >= (3,):
+    from .upgrade import (load_repository, locate_packages, upgrade_package,
+        format_package, build_extra, build_schema_version_edit, TagInstructions)
+    from .helpers import get_package_name
+else:
+    from upgrade import (load_repository, locate_packages, upgrade_package,
+        format_package, build_extra, build_schema_version_edit, TagInstructions)
+    from helpers import get_package_name
+
+
+class PreviewRepositorySchemaUpgradeCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit):
+        text = self.view.substr(sublime.Region(0, self.view.size()))
+        change_count = self.view.change_count()
+        threading.Thread(target=run_preview, args=(self.view, text, change_count)).start()
+
+
+def run_preview(view, text, change_count):
+    """
+    Computes the differences an upgrade would make and then shows them to
+    the user. Runs in a background thread.
+
+    :param view:
+        The sublime.View being upgraded
+
+    :param text:
+        The contents of the view
+
+    :param change_count:
+        The change count of the view when the text was read
+    """
+
+    status_key = 'channel_repository_tools_upgrade'
+    last_percent = [None]
+
+    def progress(converted, total):
+        percent = (100 * converted) // total
+        if percent == last_percent[0]:
+            return
+        last_percent[0] = percent
+        message = u'Comparing repository schema upgrade: %d of %d packages' % (converted, total)
+        sublime.set_timeout(lambda: view.set_status(status_key, message), 0)
+
+    try:
+        result, output, extra = preview_upgrade(text, progress)
+    except (Exception) as e:
+        result, output, extra = ('error', u'An unexpected error occurred ' +
+            u'while comparing the repository upgrade:\n\n%s: %s' % (e.__class__.__name__, e), None)
+
+    def show_result():
+        view.erase_status(status_key)
+        if result == 'error':
+            sublime.error_message(u'ChannelRepositoryTester\n\n' + output)
+        elif result == 'message':
+            sublime.message_dialog(u'ChannelRepositoryTester\n\n' + output)
+        elif not output['diffs']:
+            # Every package was upgraded in place, so only the schema_version
+            # is left to change
+            schema_edit = build_schema_version_edit(text, output['offsets'])
+            if schema_edit is None:
+                sublime.message_dialog(u'ChannelRepositoryTester\n\nUpgrading ' +
+                    u'the repository does not change any packages.')
+            elif sublime.ok_cancel_dialog(u'ChannelRepositoryTester\n\nEvery ' +
+                    u'package is already in the 3.0.0 format. Change the ' +
+                    u'schema_version to 3.0.0?'):
+                view.run_command('upgrade_repository_schema_apply', {
+                    'change_count': change_count,
+                    'edits': [schema_edit]
+                })
+        else:
+            UpgradePreview(view, text, change_count, output).show()
+
+    sublime.set_timeout(show_result, 0)
+
+
+def preview_upgrade(json_string, progress=None):
+    """
+    Upgrades each package of an old repository JSON string and compares the
+    result to the original, without serializing the whole repository
+
+    :param json_string:
+        The JSON string to compare
+
+    :param progress:
+        An optional callback that is called with the number of packages
+        compared so far and the total number of packages
+
+    :return:
+        A tuple of (result, output, extra). If the result is 'success', output
+        is a dict with the keys:
+
+         - "schema_version": the schema of the old repository
+         - "offsets": a list of (start, end) tuples of each package
+         - "diffs": a list of dicts from diff_package() for each package that
+           changed, in order
+         - "totals": a dict of the sums of the counts of all diffs
+
+        Otherwise the format is the same as upgrade_repository(). extra is
+        always None.
+    """
+
+    repo, error = load_repository(json_string)
+    if error:
+        return error
+
+    offsets = locate_packages(json_string, repo)
+    if offsets is None:
+        return ('error', u'Unable to determine the location of each package ' +
+            u'in the "packages" key.', None)
+
+    schema_version = repo['schema_version']
+    totals = {
+        'packages': len(repo['packages']),
+        'changed': 0,
+        'releases_merged': 0,
+        'platforms_collapsed': 0,
+        'create_tags': 0
+    }
+    diffs = []
+
+    for index, package in enumerate(repo['packages']):
+        create_tags = TagInstructions()
+        new_package, download_specifics = upgrade_package(package, schema_version, create_tags)
+        diff = diff_package(package, new_package, schema_version)
+        if diff is not None:
+            diff['index'] = index
+            diff['create_tags'] = create_tags
+            diff['download_specifics'] = download_specifics
+            diffs.append(diff)
+
+            totals['changed'] += 1
+            totals['releases_merged'] += diff['releases_merged']
+            totals['platforms_collapsed'] += diff['platforms_collapsed']
+            totals['create_tags'] += len(create_tags)
+
+        if progress:
+            progress(index + 1, len(repo['packages']))
+
+    output = {
+        'schema_version': schema_version,
+        'offsets': offsets,
+        'diffs': diffs,
+        'totals': totals
+    }
+    return ('success', output, None)
+
+
+def diff_package(package, new_package, schema_version):
+    """
+    Compares a package from an old repository to its upgraded version. Only
+    the top-level keys and the releases are compared, so the cost is linear
+    in the size of the package.
+
+    :param package:
+        The package info from the old repository
+
+    :param new_package:
+        The package info from upgrade_package()
+
+    :param schema_version:
+        The schema_version of the old repository
+
+    :return:
+        None if the package is unchanged, which includes packages that were
+        already in the 3.0.0 format, otherwise a dict with the keys:
+        "name", "package", "added", "removed", "changed", "releases_before",
+        "releases_after", "releases_merged" and "platforms_collapsed"
+    """
+
+    if package == new_package:
+        return None
+
+    # Releases limited to a single-item list of platforms have the list
+    # reduced to the single value
+    old_reduced = 0
+    if schema_version == '2.0':
+        old_releases = package.get('releases', [])
+        old_restricted = 0
+        for release in old_releases:
+            platforms = release.get('platforms', '*')
+            if platforms not in ('*', ['*']):
+                old_restricted += 1
+                if isinstance(platforms, list) and len(platforms) == 1:
+                    old_reduced += 1
+        num_old_releases = len(old_releases)
+    else:
+        num_old_releases = 0
+        old_restricted = 0
+        for platform, releases in package.get('platforms', {}).items():
+            num_old_releases += len(releases)
+            if platform != '*':
+                old_restricted += len(releases)
+
+    new_releases = new_package.get('releases', [])
+    new_restricted = len([release for release in new_releases if 'platforms' in release])
+    releases_merged = max(0, num_old_releases - len(new_releases))
+
+    # Only releases limited to platforms are merged, so the limited releases
+    # that were neither merged nor are still limited had their platforms
+    # removed because they support every platform
+    platforms_removed = max(0, old_restricted - releases_merged - new_restricted)
+
+    added = []
+    changed = []
+    for key in new_package:
+        if key not in package:
+            added.append(key)
+        elif package[key] != new_package[key]:
+            changed.append(key)
+    removed = [key for key in package if key not in new_package]
+
+    return {
+        'name': get_package_name(new_package) or get_package_name(package),
+        'package': new_package,
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+        'releases_before': num_old_releases,
+        'releases_after': len(new_releases),
+        'releases_merged': releases_merged,
+        'platforms_collapsed': platforms_removed + old_reduced
+    }
+
+
+def describe_diff(diff):
+    """
+    Creates a one-line description of the changes to a package
+
+    :param diff:
+        A dict from diff_package()
+
+    :return:
+        A unicode string
+    """
+
+    parts = [u'%d → %d releases' % (diff['releases_before'], diff['releases_after'])]
+    if diff['platforms_collapsed']:
+        parts.append(u'%d platform%s collapsed' % (diff['platforms_collapsed'],
+            '' if diff['platforms_collapsed'] == 1 else 's'))
+    for label in ['added', 'removed', 'changed']:
+        if diff[label]:
+            parts.append(u'%s: %s' % (label, u', '.join(diff[label])))
+    if diff['create_tags']:
+        parts.append(u'%d tag%s to create' % (len(diff['create_tags']),
+            '' if len(diff['create_tags']) == 1 else 's'))
+    return u'; '.join(parts)
+
+
+class UpgradePreview(object):
+    """
+    Shows a summary of an upgrade in an output panel and lets the user accept
+    or reject the upgrade of each package through a quick panel
+    """
+
+    def __init__(self, view, text, change_count, preview):
+        self.view = view
+        self.text = text
+        self.change_count = change_count
+        self.preview = preview
+        self.accepted = [True] * len(preview['diffs'])
+
+    def show(self):
+        window = self.view.window()
+        totals = self.preview['totals']
+
+        summary = u'Schema Upgrade Preview\n\n' + \
+            u'  Packages: %d (%d changed)\n' % (totals['packages'], totals['changed']) + \
+            u'  Releases merged: %d\n' % totals['releases_merged'] + \
+            u'  Platforms collapsed: %d\n' % totals['platforms_collapsed'] + \
+            u'  Tag instructions: %d\n\n' % totals['create_tags']
+        for diff in self.preview['diffs']:
+            summary += u'  %s\n    %s\n' % (diff['name'], describe_diff(diff))
+
+        panel = window.get_output_panel('channel_repository_tools_upgrade')
+        panel.settings().set('word_wrap', True)
+        panel.run_command('select_all')
+        panel.run_command('right_delete')
+        panel.run_command('channel_repository_tools_insert', {'string': summary})
+        window.run_command('show_panel', {'panel': 'output.channel_repository_tools_upgrade'})
+
+        self.show_quick_panel(0)
+
+    def show_quick_panel(self, selected_index):
+        num_accepted = sum(self.accepted)
+        items = [
+            [u'Apply %d accepted package%s' % (num_accepted, '' if num_accepted == 1 else 's'),
+                u'Upgrade the accepted packages and leave the rest untouched'],
+            [u'Accept all', u'Mark every package as accepted'],
+            [u'Reject all', u'Mark every package as rejected']
+        ]
+        for i, diff in enumerate(self.preview['diffs']):
+            mark = u'[x]' if self.accepted[i] else u'[ ]'
+            items.append([u'%s %s' % (mark, diff['name']), describe_diff(diff)])
+
+        window = self.view.window()
+        if int(sublime.version()) >= 3000:
+            window.show_quick_panel(items, self.on_select, 0, selected_index)
+        else:
+            window.show_quick_panel(items, self.on_select)
+
+    def on_select(self, index):
+        if index == -1:
+            return
+
+        if index == 0:
+            self.apply()
+            return
+
+        if index == 1:
+            self.accepted = [True] * len(self.accepted)
+        elif index == 2:
+            self.accepted = [False] * len(self.accepted)
+        else:
+            self.accepted[index - 3] = not self.accepted[index - 3]
+
+        # Reopening from inside of the callback does not work on all builds
+        sublime.set_timeout(lambda: self.show_quick_panel(index), 10)
+
+    def apply(self):
+        offsets = self.preview['offsets']
+        edits = []
+        create_tags = TagInstructions()
+        has_download_specifics = False
+
+        for i, diff in enumerate(self.preview['diffs']):
+            if not self.accepted[i]:
+                continue
+            start, end = offsets[diff['index']]
+            edits.append((start, end, format_package(diff['package'])))
+            create_tags.update(diff['create_tags'])
+            has_download_specifics = has_download_specifics or diff['download_specifics']
+
+        if not edits:
+            return
+
+        # Packages that did not change are already in the 3.0.0 format, so
+        # they do not need to be accepted for the repository to be fully
+        # upgraded. Rejected packages are left in the old format, and since
+        # upgraded packages are skipped, a later upgrade can finish the job.
+        if all(self.accepted):
+            schema_edit = build_schema_version_edit(self.text, offsets)
+            if schema_edit:
+                edits.insert(0, schema_edit)
+
+        extra = build_extra(create_tags, has_download_specifics, self.preview['schema_version'])
+
+        self.view.window().run_command('hide_panel', {'panel': 'output.channel_repository_tools_upgrade'})
+        self.view.run_command('upgrade_repository_schema_apply', {
+            'change_count': self.change_count,
+            'edits': edits,
+            'extra': extra,
+            'tags': create_tags.report()
+        })
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+
+import json
+import functools
+import os
+import sys
+import threading
+import time
+import unittest
+
+import sublime
+import sublime_plugin
+
+if sys.version_info >= (3,):
+    from .tests import (StringQueue, find_channel_folder, load_tests_module,
+        show_channel_folder_error)
+    from .helpers import get_package_name
+else:
+    from tests import (StringQueue, find_channel_folder, load_tests_module,
+        show_channel_folder_error)
+    from helpers import get_package_name
+
+
+# How long to wait after the last save before revalidating, in milliseconds
+DEBOUNCE_DELAY = 300
+
+REGION_KEY = 'channel_repository_tools_watch'
+
+# The ids of windows that have watch mode enabled
+watched_windows = set()
+
+# The number of saves for each view, used to debounce revalidation
+pending_saves = {}
+
+# Per-file state from the last validation, keyed by file path. Each value is a
+# dict with the keys "stamp", "fingerprints" and "failures".
+snapshots = {}
+
+# Phantom sets for views, only used on builds that support phantoms
+phantom_sets = {}
+
+# Only one validation is run at a time since the tests require changing
+# the working directory of the process
+validation_lock = threading.Lock()
+
+# Class attributes of the channel's TestContainer that collect names while
+# the tests run, so uniqueness can be checked across packages. They are
+# shared by every subclass, so they have to be reset when the warm module is
+# reused, otherwise a revalidated package would conflict with itself.
+TEST_STATE_ATTRIBUTES = ['package_names', 'dependency_names', 'previous_package_names']
+
+
+class ToggleRepositoryWatchCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        window_id = self.window.id()
+        if window_id in watched_windows:
+            watched_windows.remove(window_id)
+            for view in self.window.views():
+                clear_failures(view)
+            sublime.status_message(u'ChannelRepositoryTools: watch mode disabled')
+            return
+
+        if find_channel_folder(self.window) is None:
+            show_channel_folder_error()
+            return
+
+        watched_windows.add(window_id)
+        sublime.status_message(u'ChannelRepositoryTools: watch mode enabled')
+
+    def is_checked(self):
+        return self.window.id() in watched_windows
+
+
+class RepositoryWatchListener(sublime_plugin.EventListener):
+
+    def on_post_save(self, view):
+        window = view.window()
+        if window is None or window.id() not in watched_windows:
+            return
+
+        path = view.file_name()
+        folder = find_channel_folder(window)
+        if folder is None or not is_repository_file(folder, path):
+            return
+
+        view_id = view.id()
+        pending_saves[view_id] = pending_saves.get(view_id, 0) + 1
+        save_number = pending_saves[view_id]
+
+        def revalidate():
+            # Another save happened after this one, so let it do the work
+            if pending_saves.get(view_id) != save_number:
+                return
+            threading.Thread(target=validate_file, args=(view, folder, path)).start()
+
+        sublime.set_timeout(revalidate, DEBOUNCE_DELAY)
+
+    def on_close(self, view):
+        pending_saves.pop(view.id(), None)
+        phantom_sets.pop(view.id(), None)
+
+
+def is_repository_file(folder, path):
+    """
+    Determines if a file is one of the repository JSON files of a channel
+
+    :param folder:
+        The path to the package_control_channel folder
+
+    :param path:
+        The path of the file that was saved
+
+    :return:
+        A bool
+    """
+
+    if not path or not path.endswith('.json'):
+        return False
+
+    path = os.path.normcase(os.path.abspath(path))
+    folder = os.path.normcase(os.path.abspath(folder))
+
+    if path == os.path.join(folder, 'repository.json'):
+        return True
+    return os.path.dirname(path) == os.path.join(folder, 'repository')
+
+
+def fingerprint_packages(data):
+    """
+    Creates a fingerprint of every package in a repository so that edits can
+    be detected without keeping the previous object tree around
+
+    :param data:
+        The parsed repository JSON
+
+    :return:
+        A dict with package names as keys and strings as values
+    """
+
+    fingerprints = {}
+    for package in data.get('packages', []):
+        name = get_package_name(package)
+        if name is not None:
+            fingerprints[name] = json.dumps(package, sort_keys=True)
+    return fingerprints
+
+
+def find_test_package(test, path):
+    """
+    Determines what package a generated test is for
+
+    :param test:
+        A (function, args) tuple yielded by TestContainer._include_tests()
+
+    :param path:
+        The path of the repository being tested
+
+    :return:
+        The package name, or None if the test is for the whole repository
+    """
+
+    release_suffix = ' (%s)' % path
+    for arg in test[1]:
+        if isinstance(arg, dict):
+            if 'packages' in arg:
+                return None
+            return get_package_name(arg)
+        if isinstance(arg, (str, type(u''))) and arg.endswith(release_suffix):
+            return arg[:-len(release_suffix)]
+    return None
+
+
+def record_failures(test, package_name, failures):
+    """
+    Wraps a generated test so that any failure is recorded against the
+    package it was generated for
+
+    :param test:
+        A (function, args) tuple yielded by TestContainer._include_tests()
+
+    :param package_name:
+        The name of the package, or None for repository-wide tests
+
+    :param failures:
+        A dict to add failure messages to, keyed by package name
+
+    :return:
+        A (function, args) tuple
+    """
+
+    func, args = test
+
+    @functools.wraps(func)
+    def wrapper(*call_args):
+        try:
+            return func(*call_args)
+        except (Exception) as e:
+            failures.setdefault(package_name, []).append(str(e).strip().split('\n')[0])
+            raise
+
+    return (wrapper, args)
+
+
+def reset_test_state(test_class, data, touched):
+    """
+    Gives a test class its own empty copy of the attributes in
+    TEST_STATE_ATTRIBUTES, and then fills them in from the packages and
+    dependencies that are not being revalidated. A touched package that
+    takes the name or a previous name of an untouched one is then still
+    reported, like it would be by a full run of the tests.
+
+    :param test_class:
+        The subclass of the channel's TestContainer about to be run
+
+    :param data:
+        The parsed repository JSON
+
+    :param touched:
+        A set of the names of the packages that are being revalidated
+    """
+
+    for attr in TEST_STATE_ATTRIBUTES:
+        value = getattr(test_class, attr, None)
+        if isinstance(value, (set, dict, list)):
+            setattr(test_class, attr, type(value)())
+
+    package_names = []
+    previous_names = []
+    for package in data.get('packages', []):
+        name = get_package_name(package)
+        if name is None or name in touched:
+            continue
+        package_names.append((name, name))
+        for previous_name in package.get('previous_names', []):
+            previous_names.append((previous_name, name))
+
+    # Dependencies are never revalidated by watch mode, so all are untouched
+    dependency_names = []
+    for key in ['dependencies', 'libraries']:
+        for dependency in data.get(key, []):
+            if 'name' in dependency:
+                dependency_names.append((dependency['name'], dependency['name']))
+
+    add_test_state(test_class, 'package_names', package_names)
+    add_test_state(test_class, 'previous_package_names', previous_names)
+    add_test_state(test_class, 'dependency_names', dependency_names)
+
+
+def add_test_state(test_class, attr, items):
+    """
+    Adds names to one of the attributes in TEST_STATE_ATTRIBUTES, whichever
+    type of collection the channel's tests use for it
+
+    :param test_class:
+        The subclass of the channel's TestContainer about to be run
+
+    :param attr:
+        The name of the attribute
+
+    :param items:
+        A list of (name, owner) tuples. Dicts map each name to the package
+        that owns it, sets and lists only hold the names.
+    """
+
+    value = getattr(test_class, attr, None)
+    for name, owner in items:
+        if isinstance(value, dict):
+            value[name] = owner
+        elif isinstance(value, set):
+            value.add(name)
+        elif isinstance(value, list):
+            value.append(name)
+
+
+def validate_file(view, folder, path):
+    """
+    Revalidates the packages in a repository file that have been modified
+    since the last validation. Runs in a background thread.
+
+    :param view:
+        The sublime.View the file was saved from
+
+    :param folder:
+        The path to the package_control_channel folder
+
+    :param path:
+        The path of the repository file
+    """
+
+    with validation_lock:
+        start = time.time()
+        snapshot = snapshots.get(path, {'stamp': None, 'fingerprints': None, 'failures': {}})
+
+        try:
+            with open(path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+            fingerprints = fingerprint_packages(data)
+        except (Exception) as e:
+            failures = {None: [u'Unable to parse JSON: %s' % e]}
+            sublime.set_timeout(lambda: show_failures(view, failures, 0, time.time() - start), 0)
+            return
+
+        try:
+            tests, stamp = load_tests_module(folder)
+        except (Exception) as e:
+            failures = {None: [u'Unable to load the channel tests: %s' % e]}
+            sublime.set_timeout(lambda: show_failures(view, failures, 0, time.time() - start), 0)
+            return
+
+        old_fingerprints = snapshot['fingerprints']
+
+        if old_fingerprints is None or snapshot['stamp'] != stamp:
+            touched = set(fingerprints)
+        else:
+            touched = set()
+            for name in fingerprints:
+                if old_fingerprints.get(name) != fingerprints[name]:
+                    touched.add(name)
+
+        new_failures = {}
+
+        class RepositoryTests(tests.TestContainer, unittest.TestCase):
+            @classmethod
+            def generate_repository_tests(cls, stream):
+                for test in cls._include_tests(path, stream):
+                    package_name = find_test_package(test, path)
+                    if package_name is None or package_name in touched:
+                        yield record_failures(test, package_name, new_failures)
+
+        reset_test_state(RepositoryTests, data, touched)
+
+        if sys.version_info >= (3,):
+            old_path = os.getcwd()
+        else:
+            old_path = os.getcwdu()
+
+        os.chdir(folder)
+        try:
+            tests.generate_test_methods(RepositoryTests, StringQueue())
+            suite = unittest.TestLoader().loadTestsFromTestCase(RepositoryTests)
+            suite.run(unittest.TestResult())
+        except (Exception) as e:
+            failures = {None: [u'Unable to run the channel tests: %s' % e]}
+            sublime.set_timeout(lambda: show_failures(view, failures, 0, time.time() - start), 0)
+            return
+        finally:
+            os.chdir(old_path)
+
+        # Untouched packages keep their failures from the previous run
+        failures = {}
+        for name, messages in snapshot['failures'].items():
+            if name is not None and name in fingerprints and name not in touched:
+                failures[name] = messages
+        failures.update(new_failures)
+
+        snapshots[path] = {'stamp': stamp, 'fingerprints': fingerprints, 'failures': failures}
+
+        elapsed = time.time() - start
+        sublime.set_timeout(lambda: show_failures(view, failures, len(touched), elapsed), 0)
+
+
+def clear_failures(view):
+    """
+    Removes any inline failures from a view
+
+    :param view:
+        A sublime.View
+    """
+
+    view.erase_regions(REGION_KEY)
+    if view.id() in phantom_sets:
+        phantom_sets[view.id()].update([])
+
+
+def escape_html(string):
+    """
+    Escapes a string for use in the HTML of a phantom
+
+    :param string:
+        The string to escape
+
+    :return:
+        The escaped string
+    """
+
+    return string.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def find_package_region(view, package_name):
+    """
+    Finds the line of a view where a package is defined
+
+    :param view:
+        A sublime.View
+
+    :param package_name:
+        The name of the package, or None for the start of the file
+
+    :return:
+        A sublime.Region
+    """
+
+    if package_name is not None:
+        needle = '"name": %s' % json.dumps(package_name, ensure_ascii=False)
+        region = view.find(needle, 0, sublime.LITERAL)
+        if region is None or region.begin() == -1:
+            region = view.find('/%s"' % package_name, 0, sublime.LITERAL)
+        if region is not None and region.begin() != -1:
+            return view.line(region)
+    return view.line(0)
+
+
+def show_failures(view, failures, num_touched, elapsed):
+    """
+    Displays failures inline in a view. Runs in the main thread.
+
+    :param view:
+        A sublime.View
+
+    :param failures:
+        A dict of package names to lists of failure messages
+
+    :param num_touched:
+        The number of packages that were revalidated
+
+    :param elapsed:
+        The number of seconds the validation took
+    """
+
+    clear_failures(view)
+
+    regions = []
+    phantoms = []
+    for package_name, messages in failures.items():
+        region = find_package_region(view, package_name)
+        regions.append(region)
+        if hasattr(sublime, 'Phantom'):
+            html = u'<body><div style="color: var(--redish)">%s</div></body>' % (
+                u'<br>'.join([escape_html(message) for message in messages]))
+            phantoms.append(sublime.Phantom(sublime.Region(region.end()), html, sublime.LAYOUT_BELOW))
+
+    view.add_regions(REGION_KEY, regions, 'invalid', 'dot', sublime.DRAW_OUTLINED)
+
+    if hasattr(sublime, 'PhantomSet'):
+        if view.id() not in phantom_sets:
+            phantom_sets[view.id()] = sublime.PhantomSet(view, REGION_KEY)
+        phantom_sets[view.id()].update(phantoms)
+
+    num_failures = sum([len(messages) for messages in failures.values()])
+    sublime.status_message(u'ChannelRepositoryTools: revalidated %d package%s in %.2fs, %d failure%s' % (
+        num_touched, '' if num_touched == 1 else 's', elapsed,
+        num_failures, '' if num_failures == 1 else 's'))